@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Offline throughput benchmarks for tap-rakuten.
+
+Synthetic reports are generated from the columns in field_types.json and
+served by a local stand-in for the ran-reporting endpoint, so the benchmarks
+need no Rakuten account or network access. Each benchmark reports rows per
+second and peak traced memory.
+
+    python benchmarks/bench_rakuten.py --rows 200000 --columns 30
+"""
+import io
+import os
+import sys
+import csv
+import gzip
+import json
+import random
+import argparse
+import threading
+import contextlib
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from singer import utils  # noqa: E402
+from singer.catalog import Catalog  # noqa: E402
+from tap_rakuten import output  # noqa: E402
+from tap_rakuten.client import Rakuten, FIELD_TYPE_REFERENCE  # noqa: E402
+from tap_rakuten.processes import TransformPool  # noqa: E402
+from tap_rakuten.streams import Stream  # noqa: E402
+from tap_rakuten.sync import sync_stream  # noqa: E402
+
+REQUIRED_COLUMNS = ['Transaction Date', 'Transaction Time']
+
+
+def get_columns(count):
+    """
+    Pick `count` report columns, always including the transaction date and
+    time so rows exercise the combined datetime transform.
+    """
+    others = [c for c in FIELD_TYPE_REFERENCE if c not in REQUIRED_COLUMNS]
+    return REQUIRED_COLUMNS + others[:max(0, count - len(REQUIRED_COLUMNS))]
+
+
+def get_value_generator(column, rng, start_date, end_date):
+    field = FIELD_TYPE_REFERENCE[column]
+    days = (end_date - start_date).days + 1
+
+    if column.endswith('Time'):
+        return lambda: '{:02d}:{:02d}:{:02d}'.format(
+            rng.randrange(24), rng.randrange(60), rng.randrange(60)
+        )
+    if field['type'] == 'date':
+        return lambda: (
+            start_date + timedelta(rng.randrange(days))
+        ).strftime('%m/%d/%y')
+    if field['type'] == 'integer':
+        return lambda: str(rng.randrange(100000))
+    if field['type'] == 'number':
+        return lambda: '{:.2f}'.format(rng.random() * 1000)
+
+    # repeated dimension values, like publisher and product names
+    values = ['{} {}'.format(column, n) for n in range(200)]
+    return lambda: rng.choice(values)
+
+
+def generate_report(columns, rows, start_date, end_date=None,
+                    null_ratio=0.2, seed=0):
+    """
+    Generate a report CSV as Rakuten serves it, with a byte order mark and
+    CRLF line endings.
+
+    Args:
+        columns (list): report column names from field_types.json
+        rows (int): number of data rows
+        start_date (datetime.datetime): first day of the report
+        end_date (datetime.datetime, optional): last day of the report
+        null_ratio (float): share of empty values
+        seed (int): random seed, so runs are comparable
+
+    Returns:
+        report (bytes): utf-8 encoded CSV
+    """
+    rng = random.Random(seed)
+    end_date = end_date or start_date
+    generators = [
+        get_value_generator(c, rng, start_date, end_date) for c in columns
+    ]
+    required = [c in REQUIRED_COLUMNS for c in columns]
+
+    buf = io.StringIO()
+    buf.write('\ufeff')
+    writer = csv.writer(buf, lineterminator='\r\n')
+    writer.writerow(columns)
+
+    for _ in range(rows):
+        writer.writerow([
+            '' if not keep and rng.random() < null_ratio else generate()
+            for generate, keep in zip(generators, required)
+        ])
+
+    return buf.getvalue().encode('utf-8')
+
+
+class ReportServer():
+    """
+    Local stand-in for the ran-reporting endpoint. Requests for future dates
+    return only the header, like Rakuten does, and responses are gzipped when
+    the client accepts it. Generated reports are kept per date range.
+    """
+
+    def __init__(self, columns, rows, null_ratio=0.2):
+        self.columns = columns
+        self.rows = rows
+        self.null_ratio = null_ratio
+        self.reports = {}
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def get_report(self, start_date, end_date):
+        key = (start_date, end_date)
+        with self._lock:
+            if key not in self.reports:
+                start = datetime.strptime(start_date, '%Y-%m-%d')
+                end = datetime.strptime(end_date, '%Y-%m-%d')
+                rows = self.rows * ((end - start).days + 1)
+                if start > datetime.utcnow():
+                    rows = 0
+                report = generate_report(
+                    self.columns, rows, start, end, self.null_ratio
+                )
+                self.reports[key] = (report, gzip.compress(report, 1))
+            return self.reports[key]
+
+    @contextlib.contextmanager
+    def serve(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                report, compressed = server.get_report(
+                    query['start_date'][0], query['end_date'][0]
+                )
+                server.requests += 1
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/csv')
+                if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                    report = compressed
+                    self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Content-Length', str(len(report)))
+                self.end_headers()
+                self.wfile.write(report)
+
+            def log_message(self, *args):
+                pass
+
+        httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+        thread.start()
+
+        try:
+            yield 'http://127.0.0.1:{}/{{region}}/reports/{{report}}/filters'.format(
+                httpd.server_port
+            )
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+
+
+def measure(name, rows, run, trace_memory=True):
+    """
+    Time `run` and, in a second pass, trace its peak memory, as tracing
+    slows down the code it measures.
+
+    Returns:
+        result (dict): name, rows, seconds, rows_per_second, peak_memory
+    """
+    started = time.perf_counter()
+    run()
+    seconds = time.perf_counter() - started
+
+    peak = None
+    if trace_memory:
+        tracemalloc.start()
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {
+        'name': name,
+        'rows': rows,
+        'seconds': round(seconds, 4),
+        'rows_per_second': round(rows / seconds) if seconds else None,
+        'peak_memory': peak
+    }
+
+
+def get_client(base_url, config=None):
+    client = Rakuten(
+        'TOKEN',
+        'en',
+        transform_pool=TransformPool.from_config(config or {})
+    )
+    client.base_url = base_url
+    return client
+
+
+def bench_report(base_url, rows, trace_memory=True):
+    client = get_client(base_url)
+    start_date = datetime.utcnow() - timedelta(days=1)
+
+    def run():
+        for _ in client.report('bench-report', start_date=start_date):
+            pass
+
+    return measure('Rakuten.report', rows, run, trace_memory)
+
+
+def bench_report_batches(base_url, rows, trace_memory=True):
+    client = get_client(base_url)
+    start_date = datetime.utcnow() - timedelta(days=1)
+
+    def run():
+        for _ in client.report_batches('bench-report', start_date=start_date):
+            pass
+
+    return measure('Rakuten.report_batches', rows, run, trace_memory)
+
+
+def bench_transform_row(columns, rows, null_ratio, trace_memory=True):
+    client = Rakuten('TOKEN', 'en')
+    report = generate_report(
+        columns, rows, datetime.utcnow(), null_ratio=null_ratio
+    )
+    reader = csv.DictReader(io.StringIO(report.decode('utf-8-sig')))
+    dict_rows = list(reader)
+    column_map = client.get_column_map(client.get_field_data(columns))
+
+    def run():
+        for row in dict_rows:
+            client.transform_row(row, column_map)
+
+    return measure('Rakuten.transform_row', rows, run, trace_memory)
+
+
+def bench_sync_stream(base_url, rows, config, trace_memory=True):
+    client = get_client(base_url, config)
+    stream_config = {
+        'report_slug': 'bench-report',
+        'date_type': 'transaction',
+        'start_date': utils.strftime(utils.now() - timedelta(days=1)),
+        **config
+    }
+
+    stream = Stream(client, stream_config)
+    stream.load_schema()
+    entry = {
+        'stream': stream.name,
+        'tap_stream_id': stream.tap_stream_id,
+        'schema': stream.schema,
+        'metadata': stream.get_metadata()
+    }
+
+    def run():
+        instance = Stream(client, stream_config)
+        instance.stream = Catalog.from_dict({'streams': [entry]}).streams[0]
+        sync_stream({}, instance)
+
+    devnull = open(os.devnull, 'wb')
+    output.set_writer(output.MessageWriter(stream=devnull))
+    try:
+        return measure('sync_stream', rows, run, trace_memory)
+    finally:
+        output.flush()
+        devnull.close()
+        if client.transform_pool is not None:
+            client.transform_pool.shutdown()
+
+
+def run_benchmarks(rows=100000, columns=30, null_ratio=0.2, config=None,
+                   trace_memory=True):
+    """
+    Run every benchmark against a local report server.
+
+    Returns:
+        results (list): one result dict per benchmark, see measure
+    """
+    report_columns = get_columns(columns)
+    server = ReportServer(report_columns, rows, null_ratio)
+
+    # generate the benchmarked day up front, outside of the measurements
+    yesterday = (datetime.utcnow() - timedelta(days=1)).strftime('%Y-%m-%d')
+    server.get_report(yesterday, yesterday)
+
+    with server.serve() as base_url:
+        return [
+            bench_report(base_url, rows, trace_memory),
+            bench_report_batches(base_url, rows, trace_memory),
+            bench_transform_row(report_columns, rows, null_ratio, trace_memory),
+            bench_sync_stream(base_url, rows, config or {}, trace_memory)
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=100000,
+                        help='rows per report day')
+    parser.add_argument('--columns', type=int, default=30,
+                        help='number of report columns')
+    parser.add_argument('--null-ratio', type=float, default=0.2,
+                        help='share of empty values')
+    parser.add_argument('--config', type=json.loads, default={},
+                        help='JSON stream config for sync_stream, '
+                             'e.g. \'{"fast_transform": true}\'')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='skip the peak memory pass')
+    parser.add_argument('--json', action='store_true',
+                        help='print results as JSON')
+    args = parser.parse_args()
+
+    results = run_benchmarks(
+        rows=args.rows,
+        columns=args.columns,
+        null_ratio=args.null_ratio,
+        config=args.config,
+        trace_memory=not args.no_memory
+    )
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for result in results:
+        peak = result['peak_memory']
+        print('{name:<24} {rows_per_second:>10,} rows/s {peak}'.format(
+            peak='' if peak is None else '{:>8.1f} MB peak'.format(peak / 1e6),
+            **result
+        ))
+
+
+if __name__ == '__main__':
+    main()
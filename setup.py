@@ -13,6 +13,10 @@ setup(
         "singer-python==5.4.1",
         "requests==2.21.0"
     ],
+    extras_require={
+        "fast": ["orjson", "numpy"],
+        "export": ["pyarrow"]
+    },
     entry_points="""
     [console_scripts]
     tap-rakuten=tap_rakuten:main
@@ -3,41 +3,60 @@ import os
 import json
 import singer
 
+from concurrent.futures import ThreadPoolExecutor
 from singer import utils, metadata
+from singer.catalog import Catalog
+from tap_rakuten import output
+from tap_rakuten import instrumentation
+from tap_rakuten.backfill import ShardStream, WorkQueue, run_backfill
+from tap_rakuten.cache import SchemaCache, ResponseCache
 from tap_rakuten.client import Rakuten
-from tap_rakuten.streams import get_stream
+from tap_rakuten.export import FileExporter
+from tap_rakuten.processes import TransformPool
+from tap_rakuten.ratelimit import RateLimiter
+from tap_rakuten.streams import Stream, check_reports_config, get_streams
 from tap_rakuten.sync import sync_stream
 
+# `report_slug` is required unless a `reports` list is configured
 REQUIRED_CONFIG_KEYS = [
-    "token", "region", "report_slug",
+    "token", "region",
     "start_date", "date_type"
 ]
 
 logger = singer.get_logger().getChild('tap-rakuten')
 
 
+def get_parallel_streams(config, streams):
+    return max(1, min(len(streams), int(config.get('parallel_streams', 4))))
+
+
 def discover(client, config):
     """
     Discover availalbe streams from provided configuration.
     Schema is generated dynamically based on returned column names.
-    """
 
-    # modified from supporting multiple reports to just one report at a time
+    Every report in the `reports` list is a stream; their schemas are
+    requested in parallel.
+    """
 
     streams = []
 
-    stream = get_stream(client, config)
+    instances = get_streams(client, config)
 
-    stream.load_schema()
+    with ThreadPoolExecutor(
+        max_workers=get_parallel_streams(config, instances)
+    ) as executor:
+        list(executor.map(lambda stream: stream.load_schema(), instances))
 
-    catalog_entry = {
-        'stream': stream.name,
-        'tap_stream_id': stream.tap_stream_id,
-        'schema': stream.schema,
-        'metadata': stream.get_metadata(),
-    }
+    for stream in instances:
+        catalog_entry = {
+            'stream': stream.name,
+            'tap_stream_id': stream.tap_stream_id,
+            'schema': stream.schema,
+            'metadata': stream.get_metadata(),
+        }
 
-    streams.append(catalog_entry)
+        streams.append(catalog_entry)
 
     return {'streams': streams}
 
@@ -58,16 +77,20 @@ def get_selected_streams(catalog):
     return selected_streams
 
 
-def sync(client, catalog, state, config):
+def get_selected_instances(client, catalog, config, stream_class=Stream):
     """
-    Sync streams.
+    Get the stream instances of the selected catalog entries and write their
+    SCHEMA messages.
     """
 
     selected_stream_ids = get_selected_streams(catalog)
 
-    reports = {}
-    for report in config.get('reports', []):
-        reports[report.get('report_slug')] = report
+    instances = {
+        stream.tap_stream_id: stream
+        for stream in get_streams(client, config, stream_class)
+    }
+
+    selected = []
 
     for stream in catalog.streams:
 
@@ -79,27 +102,194 @@ def sync(client, catalog, state, config):
             logger.info("%s: Skipping - not selected", stream_id)
             continue
 
-        singer.write_schema(
+        if stream_id not in instances:
+            logger.warning("%s: Skipping - not in config reports", stream_id)
+            continue
+
+        output.write_schema(
             stream_id,
             stream.schema.to_dict(),
             metadata.get(mdata, (), 'table-key-properties')
         )
 
-        instance = get_stream(
-            client,
-            config
-        )
+        instance = instances[stream_id]
 
         instance.stream = stream
 
+        selected.append(instance)
+
+    return selected
+
+
+def sync(client, catalog, state, config):
+    """
+    Sync streams. Selected streams are synced in parallel, sharing the
+    client's connection pool; each stream keeps its own bookmarks in state.
+    """
+
+    selected = get_selected_instances(client, catalog, config)
+
+    if not selected:
+        return
+
+    def run(instance):
         counter_value = sync_stream(state, instance)
 
         logger.info(
             "%s: Completed sync (%s rows)",
-            stream.tap_stream_id,
+            instance.tap_stream_id,
             counter_value
         )
 
+    max_workers = get_parallel_streams(config, selected)
+
+    if any(instance.poll_interval for instance in selected):
+        # polling streams hold their worker until the day ends, so every
+        # stream needs its own
+        max_workers = len(selected)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(run, instance) for instance in selected]
+
+    # re-raise the first failure once every other stream has finished
+    for future in futures:
+        future.result()
+
+
+def backfill(client, catalog, state, config):
+    """
+    Backfill the selected streams from a work queue shared with other tap
+    processes, see tap_rakuten.backfill.
+    """
+    options = config['backfill']
+
+    selected = get_selected_instances(client, catalog, config, ShardStream)
+
+    if not selected:
+        return
+
+    work_queue = WorkQueue(
+        options['queue_path'],
+        lease_seconds=options.get('lease_seconds', 3600),
+        max_attempts=int(options.get('max_attempts', 3))
+    )
+
+    end_date = options.get('end_date')
+
+    run_backfill(
+        work_queue,
+        selected,
+        state,
+        shard_days=int(options.get('shard_days', 7)),
+        end_date=utils.strptime_with_tz(end_date) if end_date else None,
+        worker=options.get('worker_id')
+    )
+
+    summary = work_queue.summary()
+
+    for stream_id, statuses in sorted(summary.items()):
+        logger.info("%s: backfill progress %s", stream_id, statuses)
+
+    # days that failed in earlier runs count as well, the bookmark can't move
+    # past any of them
+    failed = sum(
+        statuses.get('failed', {}).get('days', 0)
+        for statuses in summary.values()
+    )
+
+    if not failed:
+        return
+
+    exhausted = work_queue.get_exhausted_days()
+
+    message = "Backfill has {} failed days".format(failed)
+    if failed > len(exhausted):
+        message += ", run it again to retry {}".format(failed - len(exhausted))
+    if exhausted:
+        message += (
+            ". {} of them reached max_attempts ({}) and need a manual reset: "
+            "raise max_attempts or reset their attempts in the queue. "
+            "Exhausted days: {}".format(
+                len(exhausted),
+                work_queue.max_attempts,
+                ', '.join('{} {}'.format(*day) for day in exhausted[:5])
+            )
+        )
+
+    raise Exception(message)
+
+
+def get_request_timeout(config):
+    """
+    Get the (connect, read) timeout of requests from `request_timeout`, a
+    number of seconds for both or a [connect, read] pair.
+    """
+    timeout = config.get('request_timeout', [10, 300])
+    if isinstance(timeout, (list, tuple)):
+        return tuple(float(t) for t in timeout)
+    return float(timeout)
+
+
+def check_config(config):
+    utils.check_config(config, REQUIRED_CONFIG_KEYS)
+
+    if not (config.get('report_slug') or config.get('reports')):
+        raise Exception("Config is missing required key: report_slug or reports")
+
+    check_reports_config(config)
+
+
+def get_client(config):
+    """
+    Build the API client, with the caches, rate limiter, download options and
+    transform pool of the configuration.
+    """
+    schema_cache = None
+    response_cache = None
+
+    if config.get('cache_dir'):
+        schema_cache = SchemaCache(
+            config['cache_dir'],
+            ttl=config.get('schema_cache_ttl', 86400)
+        )
+
+        if config.get('response_cache') or config.get('replay'):
+            response_cache = ResponseCache(
+                config['cache_dir'],
+                trust_days=config.get('response_cache_trust_days')
+            )
+    elif config.get('replay'):
+        raise Exception("Config is missing required key for replay: cache_dir")
+
+    return Rakuten(
+        token=config['token'],
+        region=config['region'],
+        date_type=config['date_type'],
+        pool_size=max(
+            10,
+            int(config.get('workers', 1))
+            * int(config.get('parallel_streams', 4))
+        ),
+        schema_cache=schema_cache,
+        response_cache=response_cache,
+        replay=config.get('replay', False),
+        rate_limiter=RateLimiter(
+            rate=config.get('requests_per_second'),
+            burst=int(config.get('request_burst', 1))
+        ),
+        max_retries=int(config.get('max_retries', 5)),
+        timeout=get_request_timeout(config),
+        read_buffer_size=int(config.get('read_buffer_size', 1048576)),
+        prefetch_chunks=(
+            int(config.get('pipeline_queue_size', 8))
+            if config.get('pipeline') else 0
+        ),
+        transform_pool=TransformPool.from_config(config),
+        spool_dir=config.get('spool_dir'),
+        spool_max_bytes=config.get('spool_max_bytes'),
+        spool_keep=config.get('spool_keep', False)
+    )
+
 
 @utils.handle_top_exception(logger)
 def main():
@@ -107,11 +297,21 @@ def main():
     # Parse command line arguments
     args = utils.parse_args(REQUIRED_CONFIG_KEYS)
 
-    client = Rakuten(
-        token=args.config['token'],
-        region=args.config['region'],
-        date_type=args.config['date_type']
-    )
+    check_config(args.config)
+
+    output.configure(args.config)
+    instrumentation.configure(args.config)
+
+    exporter = None
+
+    if args.config.get('export'):
+        exporter = FileExporter.from_config(
+            output.get_writer(),
+            args.config['export']
+        )
+        output.set_writer(exporter)
+
+    client = get_client(args.config)
 
     # If discover flag was passed, run discovery mode and dump output to stdout
     if args.discover:
@@ -123,14 +323,26 @@ def main():
         if args.catalog:
             catalog = args.catalog
         else:
-            catalog = discover(client, args.config)
-
-        sync(
-            client,
-            catalog,
-            args.state,
-            args.config
-        )
+            catalog = Catalog.from_dict(discover(client, args.config))
+
+        try:
+            if args.config.get('backfill'):
+                backfill(client, catalog, args.state, args.config)
+            else:
+                sync(
+                    client,
+                    catalog,
+                    args.state,
+                    args.config
+                )
+        finally:
+            if exporter is not None:
+                # days that did not complete are re-synced by the next run
+                exporter.discard()
+            output.flush()
+            instrumentation.get_instrumentation().write_summary()
+            if client.transform_pool is not None:
+                client.transform_pool.shutdown()
 
 
 if __name__ == "__main__":
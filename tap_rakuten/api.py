@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+In-process API for embedding the tap in a Python loader, without serializing
+messages to stdout and parsing them back:
+
+    from tap_rakuten import api
+
+    for event in api.sync(config, state=state):
+        if event['type'] == 'RECORD':
+            load(event['stream'], event['record'])
+        elif event['type'] == 'STATE':
+            save_state(event['value'])
+
+Events are Singer messages as dicts. Bookmarks, catalog selection and every
+other config option behave like they do for the command line tap.
+
+The tap writes its messages through the process-wide writer of
+tap_rakuten.output, which a sync replaces for its duration. Only one sync can
+therefore run per process at a time, and nothing else may write tap output
+meanwhile.
+"""
+import json
+import queue
+import threading
+from singer import metadata
+from singer.catalog import Catalog
+import tap_rakuten
+from tap_rakuten import output
+from tap_rakuten import instrumentation
+from tap_rakuten.export import FileExporter
+from tap_rakuten.pipeline import Failure, DONE
+
+
+# held by the running sync, see the module docstring
+_active = threading.Lock()
+
+
+class Cancelled(BaseException):
+    # a BaseException, so record level error handling doesn't swallow it
+    pass
+
+
+class EventWriter():
+    """
+    Writer handing messages to the consumer of api.sync as dicts, through a
+    bounded queue. With `batch_size`, the records of a stream are grouped into
+    RECORDS events of up to that many records. A stream's pending records are
+    always handed over before its next SCHEMA and before any STATE.
+
+    Args:
+        events (queue.Queue): queue read by the consumer
+        cancelled (threading.Event): set when the consumer stops reading
+        batch_size (int, optional): records per RECORDS event
+        omit_nulls (bool): leave null fields out of records, like
+            MessageWriter
+    """
+
+    def __init__(self, events, cancelled, batch_size=None, omit_nulls=False):
+        self.events = events
+        self.cancelled = cancelled
+        self.batch_size = batch_size
+        self.omit_nulls = omit_nulls
+        self.batches = {}
+
+    def put(self, event):
+        while True:
+            if self.cancelled.is_set():
+                raise Cancelled()
+            try:
+                self.events.put(event, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def write(self, line):
+        # messages serialized by other writers, e.g. BATCH messages
+        self.put(json.loads(line))
+
+    def write_schema(self, stream_name, schema, key_properties):
+        self.flush_batch(stream_name)
+        self.put({
+            'type': 'SCHEMA',
+            'stream': stream_name,
+            'schema': schema,
+            'key_properties': key_properties
+        })
+
+    def write_record(self, stream_name, record):
+        if self.omit_nulls:
+            record = {k: v for k, v in record.items() if v is not None}
+
+        if not self.batch_size:
+            self.put({'type': 'RECORD', 'stream': stream_name, 'record': record})
+            return
+
+        batch = self.batches.setdefault(stream_name, [])
+        batch.append(record)
+        if len(batch) >= self.batch_size:
+            self.flush_batch(stream_name)
+
+    def write_serialized(self, stream_name, records):
+        for record in records.to_records():
+            self.write_record(stream_name, record)
+
+    def write_state(self, state):
+        self.flush()
+        self.put({'type': 'STATE', 'value': state})
+
+    def complete_window(self, stream_name, start_date, end_date):
+        self.flush_batch(stream_name)
+
+    def flush_batch(self, stream_name):
+        records = self.batches.pop(stream_name, None)
+        if records:
+            self.put({
+                'type': 'RECORDS',
+                'stream': stream_name,
+                'records': records
+            })
+
+    def flush(self):
+        if self.cancelled.is_set():
+            return
+        for stream_name in list(self.batches):
+            self.flush_batch(stream_name)
+
+
+def select_all(catalog):
+    """
+    Select every stream of a catalog, with all of its fields.
+    """
+    for stream in catalog.streams:
+        mdata = metadata.to_map(stream.metadata)
+        mdata = metadata.write(mdata, (), 'selected', True)
+        stream.metadata = metadata.to_list(mdata)
+    return catalog
+
+
+def discover(config):
+    """
+    Discover the configured reports.
+
+    Returns:
+        catalog (dict): catalog like the tap writes in discovery mode
+    """
+    tap_rakuten.check_config(config)
+    return tap_rakuten.discover(tap_rakuten.get_client(config), config)
+
+
+def sync(config, catalog=None, state=None, batch_size=None, queue_size=1000):
+    """
+    Sync the selected streams and yield their messages as they are produced.
+    The sync runs on a separate thread, up to `queue_size` events ahead of
+    the consumer. Closing the generator stops it. Only one sync can run per
+    process at a time.
+
+    Args:
+        config (dict): tap configuration
+        catalog (dict or singer.catalog.Catalog, optional): catalog with
+            selected streams, every configured report by default
+        state (dict, optional): state to resume from; it is updated in place
+            as bookmarks move
+        batch_size (int, optional): yield RECORDS events of up to this many
+            records instead of one RECORD event per record
+        queue_size (int): events buffered ahead of the consumer
+
+    Yields:
+        event (dict): SCHEMA, RECORD or RECORDS, STATE and, with file export,
+            BATCH messages
+
+    Raises:
+        RuntimeError: another sync is running in this process
+    """
+    if not _active.acquire(blocking=False):
+        raise RuntimeError("Another tap_rakuten.api.sync is already running "
+                           "in this process")
+    try:
+        yield from run_sync(config, catalog, state, batch_size, queue_size)
+    finally:
+        _active.release()
+
+
+def run_sync(config, catalog, state, batch_size, queue_size):
+    tap_rakuten.check_config(config)
+    instrumentation.configure(config)
+
+    client = tap_rakuten.get_client(config)
+
+    if catalog is None:
+        catalog = select_all(Catalog.from_dict(
+            tap_rakuten.discover(client, config)
+        ))
+    elif isinstance(catalog, dict):
+        catalog = Catalog.from_dict(catalog)
+
+    state = {} if state is None else state
+
+    events = queue.Queue(queue_size)
+    cancelled = threading.Event()
+
+    event_writer = EventWriter(
+        events,
+        cancelled,
+        batch_size,
+        omit_nulls=config.get('omit_null_fields', False)
+    )
+    writer = event_writer
+    if config.get('export'):
+        writer = FileExporter.from_config(writer, config['export'])
+
+    def produce():
+        try:
+            if config.get('backfill'):
+                tap_rakuten.backfill(client, catalog, state, config)
+            else:
+                tap_rakuten.sync(client, catalog, state, config)
+            writer.flush()
+            event_writer.put(DONE)
+        except Cancelled:
+            pass
+        except BaseException as e:
+            try:
+                event_writer.put(Failure(e))
+            except Cancelled:
+                pass
+
+    previous = output.get_writer()
+    output.set_writer(writer)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+
+    try:
+        while True:
+            event = events.get()
+            if event is DONE:
+                return
+            if isinstance(event, Failure):
+                raise event.error
+            yield event
+    finally:
+        cancelled.set()
+        producer.join()
+        if isinstance(writer, FileExporter):
+            writer.discard()
+        output.set_writer(previous)
+        instrumentation.get_instrumentation().write_summary()
+        if client.transform_pool is not None:
+            client.transform_pool.shutdown()
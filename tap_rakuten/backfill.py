@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+import os
+import time
+import socket
+import sqlite3
+import singer
+from contextlib import contextmanager
+from datetime import timedelta
+from singer import utils
+from tap_rakuten import output
+from tap_rakuten.streams import DAY_FMT, Stream, start_of_day, to_day
+from tap_rakuten.sync import sync_stream
+
+logger = singer.get_logger().getChild('tap-rakuten')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shards (
+    stream TEXT NOT NULL,
+    start_day TEXT NOT NULL,
+    end_day TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    claimed_at REAL,
+    PRIMARY KEY (stream, start_day)
+);
+CREATE TABLE IF NOT EXISTS days (
+    stream TEXT NOT NULL,
+    day TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    rows INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    worker TEXT,
+    updated_at REAL,
+    PRIMARY KEY (stream, day)
+);
+"""
+
+
+def get_worker_id():
+    return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+
+class Shard():
+    """
+    A contiguous range of days of one stream, claimed by a single worker.
+    """
+
+    def __init__(self, stream, start_day, end_day):
+        self.stream = stream
+        self.start_day = start_day
+        self.end_day = end_day
+
+    def __repr__(self):
+        return '{} {} to {}'.format(self.stream, self.start_day, self.end_day)
+
+
+class WorkQueue():
+    """
+    SQLite work queue of a backfill. The date range of every stream is split
+    into shards of `shard_days` days, and the status (pending, done or
+    failed), row count and error of every day is recorded, so several tap
+    processes can share the queue file and an interrupted or partly failed
+    backfill only reruns the days that are not done.
+
+    Shards are claimed in a write transaction, so no two workers ever run the
+    same shard. A running shard whose worker stopped renewing its lease for
+    `lease_seconds` is handed to the next worker.
+
+    Args:
+        path (string): SQLite database file
+        lease_seconds (float): seconds before a running shard is reclaimed
+        max_attempts (int): failed days are given up after this many attempts
+    """
+
+    def __init__(self, path, lease_seconds=3600, max_attempts=3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+        conn = sqlite3.connect(self.path, timeout=60)
+        try:
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+
+    @contextmanager
+    def connect(self):
+        """
+        Open a connection in a write transaction. Every operation uses its own
+        connection, so the queue can be shared by threads and processes.
+        """
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+    def plan(self, stream, start_date, end_date, shard_days=7):
+        """
+        Add the days and shards of a stream's date range. Planning the same
+        range again, e.g. from another worker, only adds what is missing, and
+        failed shards with days left to retry are pending again.
+        """
+        days = []
+        date = start_date
+        while date <= end_date:
+            days.append(date.strftime(DAY_FMT))
+            date += timedelta(1)
+
+        shards = [
+            (stream, chunk[0], chunk[-1])
+            for chunk in (
+                days[n:n + shard_days] for n in range(0, len(days), shard_days)
+            )
+        ]
+
+        with self.connect() as conn:
+            conn.executemany(
+                'INSERT OR IGNORE INTO days (stream, day) VALUES (?, ?)',
+                [(stream, day) for day in days]
+            )
+            conn.executemany(
+                'INSERT OR IGNORE INTO shards (stream, start_day, end_day) '
+                'VALUES (?, ?, ?)',
+                shards
+            )
+            conn.execute(
+                "UPDATE shards SET status = 'pending', worker = NULL "
+                "WHERE stream = ? AND status = 'failed' AND EXISTS ("
+                "  SELECT 1 FROM days WHERE days.stream = shards.stream"
+                "  AND days.day BETWEEN shards.start_day AND shards.end_day"
+                "  AND days.status != 'done' AND days.attempts < ?)",
+                (stream, self.max_attempts)
+            )
+
+    def claim(self, worker):
+        """
+        Claim the oldest pending shard, or a running shard whose lease
+        expired.
+
+        Returns:
+            shard (Shard): claimed shard, None when no work is left
+        """
+        now = time.time()
+
+        with self.connect() as conn:
+            row = conn.execute(
+                "SELECT stream, start_day, end_day FROM shards "
+                "WHERE status = 'pending' "
+                "OR (status = 'running' AND claimed_at < ?) "
+                "ORDER BY start_day, stream LIMIT 1",
+                (now - self.lease_seconds,)
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            conn.execute(
+                "UPDATE shards SET status = 'running', worker = ?, "
+                "claimed_at = ? WHERE stream = ? AND start_day = ?",
+                (worker, now, row[0], row[1])
+            )
+
+        return Shard(*row)
+
+    def get_days(self, shard):
+        """
+        Get the days of a shard that still have to run.
+        """
+        with self.connect() as conn:
+            rows = conn.execute(
+                "SELECT day FROM days WHERE stream = ? "
+                "AND day BETWEEN ? AND ? AND status != 'done' "
+                "AND attempts < ? ORDER BY day",
+                (shard.stream, shard.start_day, shard.end_day,
+                 self.max_attempts)
+            ).fetchall()
+
+        return [day for day, in rows]
+
+    def mark_day(self, shard, day, worker, rows=None, error=None):
+        """
+        Record the outcome of a day and renew the lease of its shard.
+        """
+        now = time.time()
+        status = 'failed' if error is not None else 'done'
+
+        with self.connect() as conn:
+            conn.execute(
+                "UPDATE days SET status = ?, rows = ?, error = ?, "
+                "attempts = attempts + 1, worker = ?, updated_at = ? "
+                "WHERE stream = ? AND day = ?",
+                (status, rows, error, worker, now, shard.stream, day)
+            )
+            conn.execute(
+                "UPDATE shards SET claimed_at = ? "
+                "WHERE stream = ? AND start_day = ? AND worker = ?",
+                (now, shard.stream, shard.start_day, worker)
+            )
+
+    def finish(self, shard):
+        """
+        Mark a shard done, or failed when any of its days is not done.
+        """
+        with self.connect() as conn:
+            (remaining,) = conn.execute(
+                "SELECT COUNT(*) FROM days WHERE stream = ? "
+                "AND day BETWEEN ? AND ? AND status != 'done'",
+                (shard.stream, shard.start_day, shard.end_day)
+            ).fetchone()
+
+            conn.execute(
+                "UPDATE shards SET status = ? "
+                "WHERE stream = ? AND start_day = ?",
+                ('failed' if remaining else 'done', shard.stream,
+                 shard.start_day)
+            )
+
+    def get_bookmarks(self):
+        """
+        Merge the progress of every shard into one bookmark per stream: the
+        last day before which every day of the backfill is done.
+
+        Returns:
+            bookmarks (dict): last contiguous done day by stream
+        """
+        with self.connect() as conn:
+            rows = conn.execute(
+                "SELECT stream, day, status FROM days ORDER BY stream, day"
+            ).fetchall()
+
+        bookmarks = {}
+        blocked = set()
+
+        for stream, day, status in rows:
+            if stream in blocked:
+                continue
+            if status != 'done':
+                blocked.add(stream)
+                continue
+            bookmarks[stream] = day
+
+        return bookmarks
+
+    def get_exhausted_days(self):
+        """
+        Get the failed days that are never retried, having failed
+        `max_attempts` times.
+
+        Returns:
+            days (list): (stream, day) in date order
+        """
+        with self.connect() as conn:
+            return conn.execute(
+                "SELECT stream, day FROM days WHERE status = 'failed' "
+                "AND attempts >= ? ORDER BY day, stream",
+                (self.max_attempts,)
+            ).fetchall()
+
+    def summary(self):
+        """
+        Count the days and rows of every stream by status.
+
+        Returns:
+            summary (dict): {stream: {status: {'days': n, 'rows': n}}}
+        """
+        with self.connect() as conn:
+            rows = conn.execute(
+                "SELECT stream, status, COUNT(*), COALESCE(SUM(rows), 0) "
+                "FROM days GROUP BY stream, status"
+            ).fetchall()
+
+        summary = {}
+        for stream, status, days, row_count in rows:
+            summary.setdefault(stream, {})[status] = {
+                'days': days,
+                'rows': row_count
+            }
+        return summary
+
+
+class ShardStream(Stream):
+    """
+    Stream syncing one claimed day at a time. Bookmarks are not moved per
+    day; the backfill emits the state merged from the work queue instead.
+    """
+
+    def __init__(self, client, stream_config):
+        super().__init__(client, stream_config)
+        self.lookback_start = None
+
+    def get_bookmark(self, state):
+        # the claimed day is the start date, whatever the state says
+        return None
+
+    def next_window(self, start_date, last_date):
+        return (start_date, start_date)
+
+    def write_bookmark(self, state, window):
+        self.commit_window(window)
+
+
+def write_state(state, work_queue):
+    """
+    Move the bookmarks of the state to the merged backfill progress. Bookmarks
+    never move backwards.
+    """
+    for stream, day in work_queue.get_bookmarks().items():
+        value = utils.strftime(to_day(day))
+        bookmark = singer.get_bookmark(state, stream, 'last_sync')
+        if bookmark and utils.strptime_with_tz(bookmark) >= to_day(day):
+            continue
+        output.write_bookmark(state, stream, 'last_sync', value)
+
+
+def run_backfill(work_queue, instances, state, shard_days=7, end_date=None,
+                 worker=None):
+    """
+    Plan the backfill of every stream, then claim and sync shards until no
+    work is left. Failed days are recorded and skipped; running the backfill
+    again retries only them.
+
+    Args:
+        work_queue (WorkQueue): shared work queue
+        instances (list): ShardStream instances with their catalog entries
+        state (dict): state to merge the backfill progress into
+        shard_days (int): days per shard
+        end_date (datetime.datetime, optional): last day, yesterday by default
+        worker (string, optional): worker id, host and pid by default
+
+    Returns:
+        failed (int): number of days that failed in this run
+    """
+    worker = worker or get_worker_id()
+    streams = {instance.tap_stream_id: instance for instance in instances}
+    failed = 0
+
+    for instance in instances:
+        # yesterday is the last complete day, like in Stream.iterdates
+        last_date = end_date or instance.utcnow - timedelta(1)
+        work_queue.plan(
+            instance.tap_stream_id,
+            start_of_day(utils.strptime_with_tz(instance.start_date)),
+            start_of_day(last_date),
+            shard_days
+        )
+
+    while True:
+        shard = work_queue.claim(worker)
+        if shard is None:
+            break
+
+        instance = streams.get(shard.stream)
+        if instance is None:
+            # planned by a worker with a different catalog
+            work_queue.finish(shard)
+            continue
+
+        logger.info("%s: claimed backfill shard %s", worker, shard)
+
+        for day in work_queue.get_days(shard):
+            instance.start_date = utils.strftime(to_day(day))
+            instance.end_date = instance.start_date
+
+            try:
+                rows = sync_stream(state, instance)
+            except Exception as e:
+                logger.error("%s: backfill of %s failed: %s",
+                             shard.stream, day, e)
+                work_queue.mark_day(shard, day, worker, error=str(e))
+                failed += 1
+                continue
+
+            work_queue.mark_day(shard, day, worker, rows=rows)
+            write_state(state, work_queue)
+
+        work_queue.finish(shard)
+
+    write_state(state, work_queue)
+
+    return failed
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+NUMERIC_TYPES = {
+    # schema type: (array typecode, python type, numpy dtype)
+    'integer': ('q', int, 'int64'),
+    'number': ('d', float, 'float64'),
+}
+
+NULL_STRINGS = ('', 'null')
+
+
+class NumericColumn():
+    """
+    Typed numeric column with a validity mask for nulls. Values are a numpy
+    array when numpy is installed and an array.array otherwise.
+
+    Args:
+        values (array): converted values, 0 where null
+        valid (bytearray or numpy.ndarray): 1 where the value is not null
+    """
+
+    def __init__(self, values, valid):
+        self.values = values
+        self.valid = valid
+
+    def __len__(self):
+        return len(self.values)
+
+    def to_pylist(self):
+        return [
+            v if ok else None
+            for v, ok in zip(self.values.tolist(), list(self.valid))
+        ]
+
+    def to_numpy(self):
+        return np.asarray(self.values), np.asarray(self.valid, dtype=bool)
+
+
+class DictionaryColumn():
+    """
+    Dictionary-encoded string column, for repeated dimension values such as
+    publisher and product names. Nulls have the code -1.
+
+    Args:
+        codes (array): index into dictionary for every row
+        dictionary (list): distinct values
+    """
+
+    def __init__(self, codes, dictionary):
+        self.codes = codes
+        self.dictionary = dictionary
+
+    def __len__(self):
+        return len(self.codes)
+
+    def to_pylist(self):
+        dictionary = self.dictionary
+        return [dictionary[c] if c >= 0 else None for c in self.codes]
+
+
+class ListColumn():
+    """
+    Plain column of already transformed values, e.g. combined datetimes.
+    """
+
+    def __init__(self, values):
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def to_pylist(self):
+        return list(self.values)
+
+
+class Batch():
+    """
+    A chunk of report rows as typed columns keyed by output field name.
+    """
+
+    def __init__(self, columns, num_rows):
+        self.columns = columns
+        self.num_rows = num_rows
+
+    def __len__(self):
+        return self.num_rows
+
+    def to_pydict(self):
+        return {slug: c.to_pylist() for slug, c in self.columns.items()}
+
+    def to_pylist(self):
+        """
+        Convert the batch back to row dicts, as Rakuten.report yields them.
+        """
+        slugs = list(self.columns)
+        values = [self.columns[slug].to_pylist() for slug in slugs]
+        return [dict(zip(slugs, row)) for row in zip(*values)]
+
+
+def to_numeric_column(values, typ):
+    """
+    Convert a column of CSV strings in bulk. Empty strings are null; columns
+    with any other unparseable value fall back to converting value by value.
+    Integers beyond 64 bits don't fit a typed column, so columns with such
+    values become a ListColumn of Python ints.
+    """
+    typecode, convert, dtype = NUMERIC_TYPES[typ]
+
+    if np is not None:
+        raw = np.asarray(values, dtype=str)
+        valid = raw != ''
+        converted = np.zeros(len(raw), dtype=dtype)
+        try:
+            converted[valid] = raw[valid].astype(dtype)
+            return NumericColumn(converted, valid)
+        except (ValueError, OverflowError):
+            pass
+    else:
+        valid = bytearray(v != '' for v in values)
+        try:
+            converted = array(
+                typecode,
+                [convert(v) if v != '' else 0 for v in values]
+            )
+            return NumericColumn(converted, valid)
+        except (ValueError, OverflowError):
+            pass
+
+    converted = []
+    valid = bytearray()
+    for v in values:
+        try:
+            converted.append(convert(v))
+            valid.append(1)
+        except ValueError:
+            converted.append(0)
+            valid.append(0)
+
+    try:
+        if np is not None:
+            return NumericColumn(
+                np.asarray(converted, dtype=dtype),
+                np.asarray(valid, dtype=bool)
+            )
+        return NumericColumn(array(typecode, converted), valid)
+    except OverflowError:
+        return ListColumn([
+            v if ok else None for v, ok in zip(converted, valid)
+        ])
+
+
+def to_dictionary_column(values, transform=None):
+    """
+    Dictionary-encode a column, applying transform once per distinct value.
+    """
+    codes = array('l')
+    dictionary = []
+    lookup = {}
+
+    for v in values:
+        code = lookup.get(v)
+        if code is None:
+            value = transform(v) if transform else v
+            if value is None or (transform is None and v in NULL_STRINGS):
+                code = -1
+            else:
+                code = len(dictionary)
+                dictionary.append(value)
+            lookup[v] = code
+        codes.append(code)
+
+    return DictionaryColumn(codes, dictionary)
+
+
+def compile_batch_builder(column_map, columns):
+    """
+    Compile a function converting a chunk of csv.reader rows into a Batch,
+    using the field types of a column map from Rakuten.get_column_map.
+
+    Args:
+        column_map (dict): column map for the header
+        columns (list): list of raw CSV column names, i.e. the header row
+
+    Returns:
+        builder (function): accepts a list of row lists, returns a Batch
+    """
+    index = {name.strip(): n for n, name in enumerate(columns)}
+    width = len(columns)
+    plan = []
+
+    for names, field in column_map.items():
+        positions = tuple(index[name] for name in names)
+        schema = field['schema']
+        transform = field.get('transform')
+        types = schema.get('type') or [None]
+
+        if len(positions) > 1:
+            kind = 'list'
+        elif types[0] in NUMERIC_TYPES:
+            kind = types[0]
+        elif types[0] == 'string':
+            kind = 'dictionary'
+        else:
+            kind = 'list'
+
+        plan.append((field['slug'], kind, positions, transform))
+
+    def builder(rows):
+        rows = [
+            row if len(row) >= width else row + [''] * (width - len(row))
+            for row in rows
+        ]
+        values = list(zip(*rows)) if rows else [()] * width
+
+        output = {}
+        for slug, kind, positions, transform in plan:
+            if kind in NUMERIC_TYPES:
+                output[slug] = to_numeric_column(values[positions[0]], kind)
+            elif kind == 'dictionary':
+                # date columns map a handful of distinct values, so they are
+                # transformed once per distinct value
+                output[slug] = to_dictionary_column(
+                    values[positions[0]],
+                    transform
+                )
+            elif transform:
+                output[slug] = ListColumn(list(map(
+                    transform,
+                    *(values[p] for p in positions)
+                )))
+            else:
+                output[slug] = ListColumn(list(values[positions[0]]))
+
+        return Batch(output, len(rows))
+
+    return builder
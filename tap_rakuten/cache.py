@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+import os
+import json
+import time
+import hashlib
+import tempfile
+from datetime import datetime, timedelta
+
+
+def write_atomic(path, data):
+    """
+    Write bytes to path through a temporary file in the same directory, so
+    concurrent readers never see a partially written file.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class SchemaCache():
+    """
+    On-disk cache of report columns keyed by region and report slug.
+
+    The columns (the CSV header) are cached rather than the schema itself, as
+    the schema is inferred from them locally and cheaply.
+
+    Args:
+        path (string): cache directory
+        ttl (int): seconds after which cached columns are requested again
+    """
+
+    def __init__(self, path, ttl=86400):
+        self.path = path
+        self.ttl = ttl
+
+    def get_path(self, region, report_slug):
+        return os.path.join(self.path, 'schemas', region, report_slug + '.json')
+
+    def get(self, region, report_slug, fresh=True):
+        """
+        Get the cached columns of a report.
+
+        Args:
+            region (string): report region
+            report_slug (string): report slug
+            fresh (bool): ignore columns older than the ttl
+
+        Returns:
+            columns (list): cached column names or None when missing or expired
+        """
+        try:
+            with open(self.get_path(region, report_slug)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if fresh and time.time() - entry.get('fetched_at', 0) > self.ttl:
+            return None
+
+        return entry.get('columns')
+
+    def put(self, region, report_slug, columns):
+        write_atomic(
+            self.get_path(region, report_slug),
+            json.dumps({
+                'columns': columns,
+                'fetched_at': time.time()
+            }).encode('utf-8')
+        )
+
+
+class CacheMiss(Exception):
+    pass
+
+
+class ResponseCache():
+    """
+    Content-addressed on-disk cache of raw report responses.
+
+    Response bodies are stored once per SHA-256 digest under `objects/`, and
+    an index entry per report, date_type and date range points at the digest
+    together with the response's validators (ETag and Last-Modified).
+
+    Args:
+        path (string): cache directory
+        trust_days (int, optional): cached ranges ending more than this many
+            days ago are served without revalidation
+    """
+
+    def __init__(self, path, trust_days=None):
+        self.path = os.path.join(path, 'responses')
+        self.trust_days = trust_days
+
+    def get_index_dir(self, region, report_slug, date_type):
+        return os.path.join(self.path, 'index', region, report_slug, date_type)
+
+    def get_index_path(self, key):
+        return os.path.join(
+            self.get_index_dir(key['region'], key['report_slug'],
+                               key['date_type']),
+            '{start_date}_{end_date}.json'.format(**key)
+        )
+
+    def get_object_path(self, digest):
+        return os.path.join(self.path, 'objects', digest[:2], digest)
+
+    def get(self, key):
+        """
+        Get the index entry of a cached response.
+
+        Args:
+            key (dict): region, report_slug, date_type, start_date and
+                end_date (as YYYY-MM-DD strings) of the request
+
+        Returns:
+            entry (dict): index entry or None if nothing is cached
+        """
+        try:
+            with open(self.get_index_path(key)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if not os.path.exists(self.get_object_path(entry['sha256'])):
+            return None
+
+        return entry
+
+    def is_trusted(self, entry):
+        if self.trust_days is None:
+            return False
+        end_date = datetime.strptime(entry['end_date'], "%Y-%m-%d")
+        return (datetime.utcnow() - end_date).days > self.trust_days
+
+    def put(self, key, chunks, etag=None, last_modified=None):
+        """
+        Store a response body and point the key's index entry at it.
+
+        Args:
+            key (dict): see get
+            chunks (iterable): response body as chunks of bytes
+            etag (string, optional): ETag header of the response
+            last_modified (string, optional): Last-Modified header
+
+        Returns:
+            entry (dict): the new index entry
+        """
+        objects = os.path.join(self.path, 'objects')
+        os.makedirs(objects, exist_ok=True)
+
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=objects, prefix='.tmp-')
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    f.write(chunk)
+
+            object_path = self.get_object_path(digest.hexdigest())
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            os.replace(tmp_path, object_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        entry = {
+            'sha256': digest.hexdigest(),
+            'etag': etag,
+            'last_modified': last_modified,
+            'start_date': key['start_date'],
+            'end_date': key['end_date']
+        }
+
+        return self.put_entry(key, entry)
+
+    def put_entry(self, key, entry):
+        entry = dict(entry, fetched_at=time.time())
+        write_atomic(
+            self.get_index_path(key),
+            json.dumps(entry).encode('utf-8')
+        )
+        return entry
+
+    def get_ranges(self, key):
+        """
+        Get the cached date ranges that lie within the key's date range.
+
+        Returns:
+            ranges (list): (start_date, end_date) as YYYY-MM-DD strings
+        """
+        directory = self.get_index_dir(key['region'], key['report_slug'],
+                                       key['date_type'])
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return []
+
+        ranges = []
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            start, end = name[:-5].split('_')
+            if key['start_date'] <= start and end <= key['end_date']:
+                ranges.append((start, end))
+        return ranges
+
+    def find_window(self, key, reverse=False):
+        """
+        Find the longest cached range within the key's date range that starts
+        on its first day or, with reverse, ends on its last day, so a replay
+        can request exactly the windows that were cached.
+
+        Returns:
+            range (tuple): (start_date, end_date) as YYYY-MM-DD strings or None
+        """
+        if reverse:
+            ranges = [r for r in self.get_ranges(key) if r[1] == key['end_date']]
+        else:
+            ranges = [r for r in self.get_ranges(key)
+                      if r[0] == key['start_date']]
+
+        for start, end in sorted(ranges, key=lambda r: r[0] if reverse else
+                                 r[1], reverse=not reverse):
+            if self.get(dict(key, start_date=start, end_date=end)):
+                return (start, end)
+
+        return None
+
+    def find_covering(self, key):
+        """
+        Find cached entries that together cover exactly the key's date range,
+        e.g. to replay a range that was downloaded in differently sized
+        windows. The longest cached range is preferred at each step.
+
+        Returns:
+            entries (list): index entries in date order or None
+        """
+        ranges = {}
+        for start, end in self.get_ranges(key):
+            ranges[start] = max(ranges.get(start, end), end)
+
+        entries = []
+        start_date = key['start_date']
+
+        while start_date <= key['end_date']:
+            if start_date not in ranges:
+                return None
+
+            entry = self.get(dict(
+                key, start_date=start_date, end_date=ranges[start_date]
+            ))
+            if entry is None:
+                return None
+            entries.append(entry)
+
+            start_date = (
+                datetime.strptime(ranges[start_date], "%Y-%m-%d")
+                + timedelta(1)
+            ).strftime("%Y-%m-%d")
+
+        return entries
+
+
+def fingerprint(record):
+    """
+    Compact content hash of a record, 8 bytes of BLAKE2b. Records of the same
+    report share their key order, so the items are hashed as they are.
+    """
+    if isinstance(record, str):
+        data = record.encode('utf-8')
+    else:
+        data = repr(tuple(record.items())).encode('utf-8')
+    return hashlib.blake2b(data, digest_size=8).digest()
+
+
+class FingerprintIndex():
+    """
+    On-disk index of the fingerprints of the rows emitted per report day, so a
+    re-synced day only emits rows that are new or changed. Each day is a file
+    of sorted 8 byte fingerprints.
+
+    Args:
+        path (string): cache directory
+        tap_stream_id (string): stream the fingerprints belong to
+    """
+
+    size = 8
+
+    def __init__(self, path, tap_stream_id):
+        self.path = os.path.join(path, 'fingerprints', tap_stream_id)
+
+    def get_path(self, day):
+        return os.path.join(self.path, day.strftime("%Y-%m-%d") + '.bin')
+
+    def load(self, day):
+        try:
+            with open(self.get_path(day), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return set()
+
+        size = self.size
+        return {data[i:i + size] for i in range(0, len(data), size)}
+
+    def save(self, day, fingerprints):
+        write_atomic(self.get_path(day), b''.join(sorted(fingerprints)))
+
+    def prune(self, before):
+        """
+        Delete the fingerprints of days before the given day.
+        """
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return
+
+        before = before.strftime("%Y-%m-%d") + '.bin'
+        for name in names:
+            if name.endswith('.bin') and name < before:
+                os.unlink(os.path.join(self.path, name))
+
+
+class MemoryFingerprintIndex():
+    """
+    FingerprintIndex kept in memory, for polling without a cache directory.
+    """
+
+    def __init__(self):
+        self.days = {}
+
+    def load(self, day):
+        return set(self.days.get(day, ()))
+
+    def save(self, day, fingerprints):
+        self.days[day] = set(fingerprints)
+
+    def prune(self, before):
+        for day in [day for day in self.days if day < before]:
+            del self.days[day]
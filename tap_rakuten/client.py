@@ -2,11 +2,26 @@
 import singer
 import requests
 import json
+import io
+import os
+import mmap
 import csv
+import time
 import pytz
-
+import random
+import hashlib
+import tempfile
+
+from itertools import islice
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from tap_rakuten.batches import compile_batch_builder
+from tap_rakuten.cache import CacheMiss
+from tap_rakuten.pipeline import Pipeline
+from tap_rakuten.ratelimit import RateLimiter
 from tap_rakuten.utilities import get_abs_path
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, time as dtime_time
+from functools import lru_cache
 from singer.utils import DATETIME_FMT_SAFE
 
 logger = singer.get_logger().getChild('tap-rakuten')
@@ -28,10 +43,41 @@ def utc_datetime_string(dtime):
     return dtime.replace(tzinfo=pytz.UTC).strftime(DATETIME_FMT_SAFE)
 
 
+# Report dates and times are formatted separately and memoized: a day's report
+# has only a handful of distinct dates and at most 86,400 distinct times, so
+# every distinct string is parsed once and each row only joins two strings.
+DATE_FMT, TIME_FMT = DATETIME_FMT_SAFE.split('T')
+
+
+@lru_cache(maxsize=4096)
+def format_date(string):
+    try:
+        return parse_date(string).strftime(DATE_FMT)
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=86400)
+def format_time(string):
+    try:
+        return parse_time(string).strftime(TIME_FMT)
+    except ValueError:
+        return None
+
+
+MIDNIGHT = dtime_time().strftime(TIME_FMT)
+
+
 def combine_date_time(date, time):
-    return utc_datetime_string(
-        datetime.combine(parse_date(date), parse_time(time))
-    )
+    date_string = format_date(date)
+    time_string = format_time(time)
+
+    if date_string is None or time_string is None:
+        # invalid values raise the same error as the uncached parsers
+        parse_date(date)
+        parse_time(time)
+
+    return date_string + 'T' + time_string
 
 
 def to_clean_string(string):
@@ -56,21 +102,232 @@ def to_number(string):
         return None
 
 
+def identity(value):
+    return value
+
+
 def to_datetime(string):
-    try:
-        return utc_datetime_string(parse_date(string))
-    except ValueError:
+    date_string = format_date(string)
+
+    if date_string is None:
         return None
 
+    return date_string + 'T' + MIDNIGHT
+
+
+class ChunkReader(io.RawIOBase):
+    """
+    Readable raw stream over an iterator of byte chunks, such as the already
+    decompressed chunks of `requests.Response.iter_content`, so responses can
+    be decoded by a buffered io.TextIOWrapper instead of split into lines in
+    Python. With stats, time spent waiting for chunks is recorded as the
+    `download` stage together with the number of bytes read.
+    """
+
+    def __init__(self, chunks, stats=None):
+        self._chunks = iter(chunks)
+        self._pending = memoryview(b'')
+        self._stats = stats
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._pending:
+            if self._stats is None:
+                chunk = next(self._chunks, None)
+            else:
+                with self._stats.timer('download'):
+                    chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            if self._stats is not None:
+                self._stats.add_count('bytes_downloaded', len(chunk))
+            self._pending = memoryview(chunk)
+
+        n = min(len(b), len(self._pending))
+        b[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def close(self):
+        close = getattr(self._chunks, 'close', None)
+        if close is not None:
+            close()
+        super().close()
+
+
+def response_text(resp, chunk_size=1048576, stats=None, prefetch=0):
+    """
+    Decode a streamed response as text through a large buffer. The utf-8-sig
+    codec drops the byte order mark Rakuten puts in front of the header and
+    newline='' leaves line endings inside quoted values to the csv module.
+    With prefetch, up to that many chunks are downloaded on a separate thread
+    ahead of the parser.
+    """
+    chunks = resp.iter_content(chunk_size=chunk_size)
+    if prefetch:
+        chunks = Pipeline(queue_size=prefetch, batch_size=1).run(chunks)
+
+    return io.TextIOWrapper(
+        io.BufferedReader(
+            ChunkReader(chunks, stats),
+            buffer_size=chunk_size
+        ),
+        encoding='utf-8-sig',
+        newline=''
+    )
+
+
+def chain_csv_files(files):
+    """
+    Chain the lines of several CSV files with the same header, keeping only
+    the header of the first file.
+    """
+    header = None
+
+    for f in files:
+        first = f.readline()
+        if header is None:
+            header = first
+            yield first
+        elif first != header:
+            raise APIException("Cached responses have different headers")
+
+        yield from f
+
+
+def spool_response(resp, directory, chunk_size=1048576, max_bytes=None,
+                   stats=None, prefix='report-', digest=None):
+    """
+    Download a streamed response into a temporary file at full network speed,
+    so the connection can be released before any parsing starts.
+
+    Args:
+        resp (requests.Response): streamed response
+        directory (string): spool directory
+        chunk_size (int): bytes per read from the response
+        max_bytes (int, optional): raise SpoolLimitExceeded past this size
+        stats (instrumentation.Stats, optional): records the `download` stage
+            and the number of bytes downloaded
+        prefix (string): file name prefix
+        digest (hashlib hash, optional): updated with the response content
+
+    Returns:
+        path (string): the spooled response, decompressed
+    """
+    os.makedirs(directory, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=directory, prefix=prefix, suffix='.csv')
+    size = 0
+
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            chunks = ChunkReader(
+                resp.iter_content(chunk_size=chunk_size),
+                stats
+            )
+            buf = bytearray(chunk_size)
+            while True:
+                n = chunks.readinto(buf)
+                if not n:
+                    break
+                size += n
+                if max_bytes and size > max_bytes:
+                    raise SpoolLimitExceeded(
+                        "Response exceeds the spool limit of {} bytes".format(
+                            max_bytes
+                        )
+                    )
+                f.write(memoryview(buf)[:n])
+                if digest is not None:
+                    digest.update(memoryview(buf)[:n])
+    except BaseException:
+        os.unlink(path)
+        raise
+
+    return path
+
+
+@contextmanager
+def mapped_text(path, chunk_size=1048576):
+    """
+    Decode a spooled response as text from a memory-mapped file, like
+    response_text does for a streamed one.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # empty files can't be mapped
+            yield io.StringIO('')
+            return
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mapped, 'madvise'):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+
+            text = io.TextIOWrapper(
+                io.BufferedReader(
+                    ChunkReader(iter(lambda: mapped.read(chunk_size), b'')),
+                    buffer_size=chunk_size
+                ),
+                encoding='utf-8-sig',
+                newline=''
+            )
+            try:
+                yield text
+            finally:
+                text.close()
+
 
 class APIException(Exception):
     pass
 
 
-class RateLimitException(Exception):
+class ServerException(APIException):
+    pass
+
+
+class SpoolLimitExceeded(APIException):
     pass
 
 
+class RateLimitException(Exception):
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+RETRYABLE_EXCEPTIONS = (
+    ServerException,
+    RateLimitException,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout
+)
+
+
+def parse_retry_after(value):
+    """
+    Parse a `Retry-After` header, given either in seconds or as an HTTP date.
+
+    Returns:
+        seconds (float): seconds to wait or None
+    """
+    if not value:
+        return None
+
+    try:
+        return max(0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    return max(0, (retry_at - datetime.now(pytz.UTC)).total_seconds())
+
+
 class Rakuten():
 
     base_url = "https://ran-reporting.rakutenmarketing.com/{region}/reports/{report}/filters"
@@ -88,14 +345,43 @@ class Rakuten():
         'transaction_created'
     ]
 
-    def __init__(self, token, region='en', date_type='transaction'):
+    def __init__(self, token, region='en', date_type='transaction',
+                 pool_size=10, schema_cache=None, response_cache=None,
+                 replay=False, rate_limiter=None, max_retries=5,
+                 backoff=1.0, max_backoff=60, read_buffer_size=1048576,
+                 prefetch_chunks=0, transform_pool=None, spool_dir=None,
+                 spool_max_bytes=None, spool_keep=False, timeout=(10, 300)):
         self.token = token
         self.region = region
+        self.read_buffer_size = read_buffer_size
+        self.prefetch_chunks = prefetch_chunks
+        self.transform_pool = transform_pool
+        self.spool_dir = spool_dir
+        self.spool_max_bytes = spool_max_bytes
+        self.spool_keep = spool_keep
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        # (connect, read) seconds; the read timeout also bounds the wait for
+        # each chunk of a streamed response
+        self.timeout = timeout
+        self.schema_cache = schema_cache
+        self.response_cache = response_cache
+        self.replay = replay
 
         if date_type in ('transaction', 'process'):
             self.default_params['date_type'] = date_type
 
+        # the session is shared by all worker threads, so size its
+        # connection pool to the number of concurrent requests
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size
+        )
         self._session = requests.Session()
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
 
     def get_params(self, **kwargs):
         """
@@ -154,12 +440,16 @@ class Rakuten():
             **params
         }
 
-    def get(self, report_slug, **kwargs):
+    def get(self, report_slug, headers=None, **kwargs):
         """
-        Request CSV report from Rakuten.
+        Request CSV report from Rakuten. Every request goes through the
+        client's rate limiter. Throttled requests, server errors and
+        connection failures are retried up to `max_retries` times with
+        exponential backoff and jitter, honoring `Retry-After`.
 
         Arguments:
             report_slug (string): name of report
+            headers (dict, optional): additional request headers
             start_date (datetime.datetime): start day of report
             end_date (datetime.datetime, optional): end day of report
             date_type (string, optional): must be either `transaction`
@@ -174,11 +464,285 @@ class Rakuten():
 
         params = self.get_params(**kwargs)
 
-        return self.validate_response(self._session.get(
-            url,
-            params=params,
-            stream=True
-        ))
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+
+            resp = None
+
+            try:
+                resp = self._session.get(
+                    url,
+                    params=params,
+                    headers=headers,
+                    stream=True,
+                    timeout=self.timeout
+                )
+                return self.validate_response(resp)
+            except RETRYABLE_EXCEPTIONS as e:
+                if resp is not None:
+                    resp.close()
+
+                if attempt == self.max_retries:
+                    raise
+
+                delay = self.get_retry_delay(attempt)
+
+                retry_after = getattr(e, 'retry_after', None)
+                if retry_after is not None:
+                    # hold back the other workers as well
+                    self.rate_limiter.pause(retry_after)
+                    delay = max(delay, retry_after)
+
+                logger.warning(
+                    "{} : request failed ({}), retrying in {:.1f}s.".format(
+                        report_slug, e, delay
+                    )
+                )
+                time.sleep(delay)
+
+    def get_retry_delay(self, attempt):
+        """
+        Exponential backoff with jitter: half of the delay is fixed and the
+        other half random, so concurrent workers don't retry in lockstep.
+        """
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def get_cache_key(self, report_slug, **kwargs):
+        params = self.get_params(**kwargs)
+        return {
+            'region': self.region,
+            'report_slug': report_slug,
+            'date_type': params['date_type'],
+            'start_date': params['start_date'],
+            'end_date': params['end_date']
+        }
+
+    def get_cached_window(self, report_slug, start_date, last_date,
+                          reverse=False, **kwargs):
+        """
+        Get the longest cached window from start_date or, with reverse, up to
+        last_date, see ResponseCache.find_window.
+
+        Returns:
+            window (tuple): (start_date, end_date) as YYYY-MM-DD strings or
+                None
+        """
+        key = self.get_cache_key(
+            report_slug, start_date=start_date, end_date=last_date, **kwargs
+        )
+        return self.response_cache.find_window(key, reverse=reverse)
+
+    def fetch_cached(self, report_slug, **kwargs):
+        """
+        Get the response cache entries for a report request. Cached responses
+        are revalidated with a conditional request, unless the cache trusts
+        them; changed responses are downloaded into the cache. In replay mode
+        no request is made and the range may be covered by several entries.
+
+        Returns:
+            entries (list): response cache index entries in date order
+        """
+        cache = self.response_cache
+        key = self.get_cache_key(report_slug, **kwargs)
+        entry = cache.get(key)
+
+        if self.replay:
+            entries = [entry] if entry else cache.find_covering(key)
+            if not entries:
+                raise CacheMiss(
+                    "{report_slug} : no cached response for {start_date} "
+                    "to {end_date}".format(**key)
+                )
+            return entries
+
+        if entry and cache.is_trusted(entry):
+            return [entry]
+
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        with self.get(report_slug, headers=headers, **kwargs) as r:
+            if entry and r.status_code == 304:
+                logger.info("{} : cached response not modified.".format(
+                    report_slug
+                ))
+                return [cache.put_entry(key, entry)]
+
+            new_entry = cache.put(
+                key,
+                r.iter_content(chunk_size=65536),
+                etag=r.headers.get('ETag'),
+                last_modified=r.headers.get('Last-Modified')
+            )
+
+        if entry and entry['sha256'] == new_entry['sha256']:
+            logger.info("{} : cached response unchanged.".format(report_slug))
+
+        return [new_entry]
+
+    def fetch_if_changed(self, report_slug, validators, stats=None,
+                         **kwargs):
+        """
+        Download a report unless it is unchanged since the response described
+        by `validators`. The request is conditional on the previous ETag and
+        Last-Modified; a response without them is spooled and compared by
+        its SHA-256, so an unchanged report is never parsed.
+
+        Arguments:
+            report_slug (string): name of report
+            validators (dict): `etag`, `last_modified` and `sha256` of the
+                previous response, updated in place; `changed` is set to
+                whether the report changed
+            stats (instrumentation.Stats, optional): records the `download`
+                stage and the number of bytes downloaded
+
+        Returns:
+            path (string): the spooled response, None when unchanged
+        """
+        headers = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+
+        digest = hashlib.sha256()
+
+        with self.get(report_slug, headers=headers, **kwargs) as r:
+            if headers and r.status_code == 304:
+                validators['changed'] = False
+                return None
+
+            path = spool_response(
+                r,
+                self.spool_dir or tempfile.gettempdir(),
+                chunk_size=self.read_buffer_size,
+                max_bytes=self.spool_max_bytes,
+                stats=stats,
+                prefix=report_slug + '-',
+                digest=digest
+            )
+            etag = r.headers.get('ETag')
+            last_modified = r.headers.get('Last-Modified')
+
+        sha256 = digest.hexdigest()
+        if sha256 == validators.get('sha256'):
+            os.unlink(path)
+            validators['changed'] = False
+            return None
+
+        validators.update(
+            etag=etag,
+            last_modified=last_modified,
+            sha256=sha256,
+            changed=True
+        )
+        return path
+
+    @contextmanager
+    def open_report(self, report_slug, stats=None, validators=None,
+                    **kwargs):
+        """
+        Open the CSV of a report, from the network or the response cache.
+
+        Arguments:
+            report_slug (string): name of report
+            stats (instrumentation.Stats, optional): records the `request`
+                and `download` stages
+            start_date (datetime.datetime): start day of report
+            end_date (datetime.datetime, optional): end day of report
+            date_type (string, optional): must be either `transaction`
+                or `process`
+            validators (dict, optional): skip the report when it is unchanged
+                since the previous response, see fetch_if_changed; the
+                response cache is bypassed
+
+        Yields:
+            lines (iterable): lines of CSV text, none when unchanged
+        """
+        started = time.perf_counter()
+
+        if validators is not None:
+            path = self.fetch_if_changed(
+                report_slug, validators, stats=stats, **kwargs
+            )
+            if stats is not None:
+                stats.add_time('request', time.perf_counter() - started)
+
+            if path is None:
+                yield io.StringIO('')
+                return
+
+            try:
+                with mapped_text(path, self.read_buffer_size) as text:
+                    yield text
+            finally:
+                os.unlink(path)
+            return
+
+        if self.response_cache is None and self.spool_dir:
+            with self.get(report_slug, **kwargs) as r:
+                if stats is not None:
+                    stats.add_time('request', time.perf_counter() - started)
+                path = spool_response(
+                    r,
+                    self.spool_dir,
+                    chunk_size=self.read_buffer_size,
+                    max_bytes=self.spool_max_bytes,
+                    stats=stats,
+                    prefix=report_slug + '-'
+                )
+
+            # the connection is back in the pool before parsing starts
+            try:
+                with mapped_text(path, self.read_buffer_size) as text:
+                    yield text
+            finally:
+                if not self.spool_keep:
+                    os.unlink(path)
+            return
+
+        if self.response_cache is None:
+            with self.get(report_slug, **kwargs) as r:
+                if stats is not None:
+                    stats.add_time('request', time.perf_counter() - started)
+                text = response_text(
+                    r,
+                    chunk_size=self.read_buffer_size,
+                    stats=stats,
+                    prefetch=self.prefetch_chunks
+                )
+                try:
+                    yield text
+                finally:
+                    # stop a prefetching download before the response closes
+                    text.close()
+            return
+
+        entries = self.fetch_cached(report_slug, **kwargs)
+
+        if stats is not None:
+            # downloads into the cache happen before parsing starts
+            stats.add_time('request', time.perf_counter() - started)
+
+        files = [
+            open(
+                self.response_cache.get_object_path(entry['sha256']),
+                buffering=self.read_buffer_size,
+                encoding='utf-8-sig',
+                newline=''
+            )
+            for entry in entries
+        ]
+
+        try:
+            yield chain_csv_files(files)
+        finally:
+            for f in files:
+                f.close()
 
     def validate_response(self, resp):
         """
@@ -199,10 +763,13 @@ class Rakuten():
                 raise APIException(msg.get('message'))
 
         if resp.status_code == 429:
-            raise RateLimitException("Too Many Requests")
+            raise RateLimitException(
+                "Too Many Requests",
+                retry_after=parse_retry_after(resp.headers.get('Retry-After'))
+            )
 
-        if resp.status_code in (499, 500):
-            raise APIException("Server Error")
+        if resp.status_code in (499, 500, 502, 503, 504):
+            raise ServerException("Server Error")
 
         return resp
 
@@ -223,7 +790,7 @@ class Rakuten():
             data[name] = field
         return data
 
-    def get_column_map(self, fields):
+    def get_column_map(self, fields, exclude=None):
         """
         Creates a "column map" dictionary, with tuple keys of CSV column names
         containing corresponding slug (what be the eventual field name in the
@@ -237,6 +804,9 @@ class Rakuten():
 
         Args:
             fields (dict): field data as provided by get_field_data method
+            exclude (set, optional): output field names to leave out, e.g.
+                fields deselected in the catalog. Date and time columns are
+                only combined when their datetime field isn't excluded.
 
         Returns:
             column_name: (dict): (column, [column]): {'slug':str, 'schema': {},
@@ -246,6 +816,8 @@ class Rakuten():
 
         column_map = {}
 
+        exclude = exclude or ()
+
         column_index = {f['slug']: n for n, f in fields.items()}
 
         slugs = column_index.keys()
@@ -258,19 +830,23 @@ class Rakuten():
                     column_index[column + '_time']
                 )
 
-                column_map[idx] = {
-                    'slug': column + '_datetime',
-                    'schema': {
-                        'type': ['string', 'null'],
-                        'format': 'date-time'
-                    },
-                    'transform': combine_date_time
-                }
+                if column + '_datetime' not in exclude:
+                    column_map[idx] = {
+                        'slug': column + '_datetime',
+                        'schema': {
+                            'type': ['string', 'null'],
+                            'format': 'date-time'
+                        },
+                        'transform': combine_date_time
+                    }
 
                 for id in idx:
                     del fields[id]
 
         for name, field in fields.items():
+            if field['slug'] in exclude:
+                continue
+
             schema = {}
             transform = None
             if field['type'] == 'date':
@@ -340,40 +916,127 @@ class Rakuten():
         output = {}
 
         for name, field in column_map.items():
-            transform = field.get('transform', lambda x: x)
+            transform = field.get('transform', identity)
             output[field['slug']] = transform(*(row[n] for n in name))
 
         return output
 
-    def get_schema(self, report_slug):
+    def compile_transformer(self, columns, exclude=None):
         """
-        Get the schema of a report from a report_slug.
+        Compile a transformer for rows from a plain csv.reader with the given
+        header. The column map is resolved to column positions once, so each
+        row is transformed with index lookups only, without building an
+        intermediate dict per row. Excluded fields are never converted.
+
+        Args:
+            columns (list): list of raw CSV column names, i.e. the header row
+            exclude (set, optional): output field names to leave out
+
+        Returns:
+            transformer (function): accepts a row list from csv.reader and
+                returns the transformed output row (dict)
+        """
+        index = {name.strip(): n for n, name in enumerate(columns)}
+
+        column_map = self.get_column_map(
+            self.get_field_data(columns),
+            exclude=exclude
+        )
+
+        singles = []
+        pairs = []
+
+        for names, field in column_map.items():
+            transform = field.get('transform', identity)
+            positions = tuple(index[name] for name in names)
+            if len(positions) == 1:
+                singles.append((field['slug'], transform, positions[0]))
+            else:
+                pairs.append((field['slug'], transform) + positions)
+
+        singles = tuple(singles)
+        pairs = tuple(pairs)
+        width = len(columns)
+
+        def transformer(row):
+            if len(row) < width:
+                # short rows are padded like csv.DictReader, as empty values
+                row = row + [''] * (width - len(row))
+
+            output = {
+                slug: transform(row[i], row[j])
+                for slug, transform, i, j in pairs
+            }
+
+            for slug, transform, i in singles:
+                output[slug] = transform(row[i])
+
+            return output
+
+        return transformer
+
+    def get_columns(self, report_slug):
+        """
+        Get the column names of a report from a report_slug.
 
         This method requests a report from a future date which will return a
         CSV with headers but no rows. This means faster download time for
-        initial schema definition.
+        initial schema definition. When a schema cache is set, fresh cached
+        columns are returned without a request.
 
         Args:
             report_slug (string): valid report slug
 
         Returns:
-            schema (dict): valid schema definition
+            columns (list): list of raw CSV column names
         """
+        columns = self.get_cached_columns(report_slug)
+        if columns:
+            logger.info("{} : using cached schema.".format(report_slug))
+            return columns
+
+        if self.replay:
+            raise CacheMiss("{} : no cached schema".format(report_slug))
 
         logger.info("{} : determining schema.".format(report_slug))
 
         future_date = datetime.now() + timedelta(days=2)
 
         with self.get(report_slug, start_date=future_date) as r:
-            for line in r.iter_lines(decode_unicode=True, chunk_size=10):
-                columns = line.split(",")
-                break
+            line = response_text(r, chunk_size=1024).readline()
+            columns = [c.strip() for c in next(csv.reader([line]))]
+
+        self.cache_columns(report_slug, columns)
 
-        return self.infer_schema(columns)
+        return columns
 
-    def report(self, report_slug, start_date, **kwargs):
+    def get_cached_columns(self, report_slug):
+        if self.schema_cache:
+            # replays are offline, so any cached columns will do
+            return self.schema_cache.get(
+                self.region, report_slug, fresh=not self.replay
+            )
+
+    def cache_columns(self, report_slug, columns):
+        if self.schema_cache:
+            self.schema_cache.put(self.region, report_slug, columns)
+
+    def get_schema(self, report_slug):
+        """
+        Get the schema of a report from a report_slug.
+
+        Args:
+            report_slug (string): valid report slug
+
+        Returns:
+            schema (dict): valid schema definition
         """
-        Generate a report for a particular report_slug and start_date.
+        return self.infer_schema(self.get_columns(report_slug))
+
+    def report(self, report_slug, start_date, on_header=None, stats=None,
+               exclude=None, serialize=None, validators=None, **kwargs):
+        """
+        Generate a report for a particular report_slug and date range.
 
         Only start_date required for a single day period. end_date will be
         automatically set to the same day.
@@ -384,29 +1047,156 @@ class Rakuten():
             end_date (datetime.datetime, optional): end day of report
             date_type (string, optional): must be either `transaction`
                 or `process`
+            on_header (function, optional): called with the list of raw CSV
+                column names before the first row is yielded
+            stats (instrumentation.Stats, optional): records the time spent
+                per stage and the number of rows and bytes
+            exclude (set, optional): output field names to leave out, these
+                columns are never converted
+            serialize (dict, optional): with a transform pool, have the
+                worker processes serialize RECORD messages for this `stream`
+                name, see processes.transform_chunk
+            validators (dict, optional): yield no rows when the report is
+                unchanged since the previous response, see fetch_if_changed
 
         Yields:
-            row (dict): a single standardized row from the report
+            row (dict): a single standardized row from the report, or a
+                processes.SerializedRecords chunk when serializing
         """
-        column_map = None
-
-        logger.info("{} : requesting {:%Y-%m-%d} report CSV.".format(
-            report_slug, start_date
+        logger.info("{} : requesting {:%Y-%m-%d} to {:%Y-%m-%d} report CSV.".format(
+            report_slug, start_date, kwargs.get('end_date') or start_date
         ))
 
-        with self.get(report_slug, start_date=start_date, **kwargs) as r:
-            reader = csv.DictReader(
-                r.iter_lines(decode_unicode=True),
+        with self.open_report(
+            report_slug, start_date=start_date, stats=stats,
+            validators=validators, **kwargs
+        ) as lines:
+            reader = csv.reader(
+                lines,
                 delimiter=',',
                 quotechar='"'
             )
             logger.info('{} : processing CSV data.'.format(
                 report_slug
             ))
+
+            header = next(reader, None)
+
+            if not header:
+                return
+
+            if on_header:
+                on_header(header)
+
+            if self.transform_pool is not None:
+                # rows are parsed and transformed by the worker processes
+                items = self.transform_pool.map(
+                    lines, header, exclude=exclude, serialize=serialize
+                )
+                for item in items:
+                    if stats is not None:
+                        stats.add_count(
+                            'rows',
+                            len(item) if serialize is not None else 1
+                        )
+                    yield item
+                return
+
+            transformer = self.compile_transformer(header, exclude=exclude)
+
+            if stats is not None:
+                yield from self.timed_rows(reader, transformer, stats)
+                return
+
             for row in reader:
-                if not column_map:
-                    column_map = self.get_column_map(
-                        self.get_field_data(row.keys())
-                    )
+                # csv.reader yields empty lists for blank lines
+                if row:
+                    yield transformer(row)
+
+    def timed_rows(self, reader, transformer, stats):
+        """
+        Transform rows like report does, recording the time spent in the
+        `parse` and `transform` stages. Reading from the CSV includes waiting
+        for the download, so the download time is deducted from parsing.
+        """
+        perf_counter = time.perf_counter
+        download = stats.seconds['download']
+        parse = 0
+        transform = 0
+        rows = 0
+
+        try:
+            while True:
+                started = perf_counter()
+                row = next(reader, None)
+                parsed = perf_counter()
+                parse += parsed - started
+
+                if row is None:
+                    break
+
+                if not row:
+                    continue
+
+                item = transformer(row)
+                transform += perf_counter() - parsed
+                rows += 1
+
+                yield item
+        finally:
+            downloaded = stats.seconds['download'] - download
+            stats.add_time('parse', max(0, parse - downloaded))
+            stats.add_time('transform', transform)
+            stats.add_count('rows', rows)
+
+    def report_batches(self, report_slug, start_date, batch_size=10000,
+                       exclude=None, **kwargs):
+        """
+        Generate a report like the report method, as batches of typed columns
+        instead of one dict per row. Numeric columns are converted in bulk
+        (vectorized with numpy when it is installed) and string columns are
+        dictionary-encoded.
+
+        Args:
+            report_slug (string): slug of request report
+            start_date (datetime.datetime): start date of report
+            batch_size (int): maximum number of rows per batch
+            exclude (set, optional): output field names to leave out
+            end_date (datetime.datetime, optional): end day of report
+            date_type (string, optional): must be either `transaction`
+                or `process`
+
+        Yields:
+            batch (batches.Batch): columns keyed by output field name
+        """
+        logger.info("{} : requesting {:%Y-%m-%d} to {:%Y-%m-%d} report CSV.".format(
+            report_slug, start_date, kwargs.get('end_date') or start_date
+        ))
+
+        with self.open_report(
+            report_slug, start_date=start_date, **kwargs
+        ) as lines:
+            reader = csv.reader(
+                lines,
+                delimiter=',',
+                quotechar='"'
+            )
+
+            header = next(reader, None)
+
+            if not header:
+                return
+
+            builder = compile_batch_builder(
+                self.get_column_map(self.get_field_data(header), exclude),
+                header
+            )
+
+            # csv.reader yields empty lists for blank lines
+            rows = (row for row in reader if row)
 
-                yield self.transform_row(row, column_map)
+            while True:
+                chunk = list(islice(rows, batch_size))
+                if not chunk:
+                    return
+                yield builder(chunk)
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+import os
+import gzip
+import uuid
+import singer
+from datetime import datetime
+from pathlib import Path
+from tap_rakuten.output import dumps
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+logger = singer.get_logger().getChild('tap-rakuten')
+
+FORMATS = ('jsonl', 'parquet')
+
+DEFAULT_COMPRESSION = {
+    'jsonl': 'gzip',
+    'parquet': 'snappy'
+}
+
+EXTENSIONS = {
+    'jsonl': '.jsonl',
+    'parquet': '.parquet'
+}
+
+
+def to_arrow_schema(schema):
+    """
+    Map a Singer schema to a pyarrow schema. Datetimes are kept as the
+    ISO 8601 strings RECORD messages carry.
+    """
+    fields = []
+
+    for name, field in schema.get('properties', {}).items():
+        types = field.get('type') or []
+        if isinstance(types, str):
+            types = [types]
+
+        if 'integer' in types:
+            typ = pa.int64()
+        elif 'number' in types:
+            typ = pa.float64()
+        elif 'boolean' in types:
+            typ = pa.bool_()
+        else:
+            typ = pa.string()
+
+        fields.append(pa.field(name, typ))
+
+    return pa.schema(fields)
+
+
+class PartFile():
+    """
+    A data file being written for one stream. It is written under a hidden
+    temporary name and only renamed into its partition once complete.
+    """
+
+    def __init__(self, exporter, tap_stream_id, schema):
+        self.exporter = exporter
+        self.schema = schema
+        self.name = 'part-{}-{}{}'.format(
+            exporter.run_id,
+            uuid.uuid4().hex[:8],
+            exporter.extension
+        )
+        self.tmp_path = os.path.join(
+            exporter.path,
+            tap_stream_id,
+            '.' + self.name + '.tmp'
+        )
+        self.rows = 0
+        self.buffer = []
+        self.writer = None
+
+        os.makedirs(os.path.dirname(self.tmp_path), exist_ok=True)
+
+        if exporter.format == 'jsonl':
+            if exporter.compression == 'gzip':
+                self.file = gzip.open(self.tmp_path, 'wb', compresslevel=6)
+            else:
+                self.file = open(self.tmp_path, 'wb')
+
+    def write(self, record):
+        self.rows += 1
+
+        if self.exporter.format == 'jsonl':
+            self.file.write(dumps(record))
+            return
+
+        self.buffer.append(record)
+        if len(self.buffer) >= self.exporter.row_group_size:
+            self.write_row_group()
+
+    def write_row_group(self):
+        if not self.buffer:
+            return
+
+        arrow_schema = to_arrow_schema(self.schema)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(
+                self.tmp_path,
+                arrow_schema,
+                compression=self.exporter.compression
+            )
+
+        self.writer.write_table(
+            pa.Table.from_pylist(self.buffer, schema=arrow_schema)
+        )
+        self.buffer = []
+
+    def close(self):
+        if self.exporter.format == 'jsonl':
+            self.file.close()
+            return
+
+        self.write_row_group()
+        if self.writer is not None:
+            self.writer.close()
+
+
+class FileExporter():
+    """
+    Writer that exports records to files instead of RECORD messages. Each
+    report day is written to `<path>/<stream>/date=<YYYY-MM-DD>/` as JSONL or
+    Parquet, and a BATCH message referencing the files is written to the
+    wrapped message writer when the day completes, ahead of the STATE that
+    covers it. SCHEMA and STATE messages pass through unchanged.
+
+    Records are written as they arrive; a file only appears in its partition
+    once the day has been completely emitted.
+
+    Args:
+        writer (MessageWriter): writer for the messages that go to stdout
+        path (string): root directory of the export
+        format (string): `jsonl` or `parquet`
+        compression (string, optional): `gzip` or `none` for JSONL, any
+            codec pyarrow supports for Parquet
+        row_group_size (int): records per Parquet row group
+    """
+
+    def __init__(self, writer, path, format='jsonl', compression=None,
+                 row_group_size=100000):
+        if format not in FORMATS:
+            raise Exception(
+                "Unsupported export format: {} (expected one of {})".format(
+                    format, ', '.join(FORMATS)
+                )
+            )
+        if format == 'parquet' and pa is None:
+            raise Exception("Parquet export requires pyarrow to be installed")
+        if format == 'jsonl' and compression not in (None, 'gzip', 'none'):
+            raise Exception(
+                "Unsupported JSONL export compression: {}".format(compression)
+            )
+
+        self.writer = writer
+        self.path = path
+        self.format = format
+        self.compression = compression or DEFAULT_COMPRESSION[format]
+        self.row_group_size = int(row_group_size)
+
+        self.extension = EXTENSIONS[format]
+        if format == 'jsonl' and self.compression == 'gzip':
+            self.extension += '.gz'
+
+        # file names are unique per run, so re-synced days never overwrite
+        # files a target may be loading
+        self.run_id = datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+
+        self.schemas = {}
+        self.open_parts = {}
+        self.closed_parts = {}
+
+    @classmethod
+    def from_config(cls, writer, config):
+        return cls(
+            writer,
+            path=config['path'],
+            format=config.get('format', 'jsonl'),
+            compression=config.get('compression'),
+            row_group_size=config.get('row_group_size', 100000)
+        )
+
+    def close_part(self, tap_stream_id):
+        part = self.open_parts.pop(tap_stream_id, None)
+        if part is not None:
+            part.close()
+            self.closed_parts.setdefault(tap_stream_id, []).append(part)
+
+    def write_schema(self, stream_name, schema, key_properties):
+        part = self.open_parts.get(stream_name)
+        if part is not None and part.schema != schema:
+            # a Parquet file has a single schema, start a new one
+            self.close_part(stream_name)
+
+        self.schemas[stream_name] = schema
+        self.writer.write_schema(stream_name, schema, key_properties)
+
+    def write_record(self, stream_name, record):
+        part = self.open_parts.get(stream_name)
+        if part is None:
+            part = PartFile(self, stream_name, self.schemas.get(stream_name))
+            self.open_parts[stream_name] = part
+        part.write(record)
+
+    def write_serialized(self, stream_name, records):
+        for record in records.to_records():
+            self.write_record(stream_name, record)
+
+    def complete_window(self, stream_name, start_date, end_date):
+        """
+        Move the files written since the last window into the partition of
+        its first day and reference them in a BATCH message.
+        """
+        self.close_part(stream_name)
+        parts = self.closed_parts.pop(stream_name, [])
+        if not parts:
+            return
+
+        partition = os.path.join(
+            self.path,
+            stream_name,
+            'date={}'.format(start_date.strftime('%Y-%m-%d'))
+        )
+        os.makedirs(partition, exist_ok=True)
+
+        manifest = []
+        rows = 0
+        for part in parts:
+            path = os.path.join(partition, part.name)
+            os.replace(part.tmp_path, path)
+            manifest.append(Path(path).resolve().as_uri())
+            rows += part.rows
+
+        logger.info("%s: exported %s rows for %s to %s", stream_name, rows,
+                    start_date.strftime('%Y-%m-%d'), partition)
+
+        self.writer.write(dumps({
+            'type': 'BATCH',
+            'stream': stream_name,
+            'encoding': {
+                'format': self.format,
+                'compression': self.compression
+            },
+            'manifest': manifest
+        }))
+
+    def write_state(self, state):
+        self.writer.write_state(state)
+
+    def flush(self):
+        self.writer.flush()
+
+    def discard(self):
+        """
+        Remove the temporary files of windows that never completed.
+        """
+        for stream_name in list(self.open_parts):
+            self.close_part(stream_name)
+        for parts in self.closed_parts.values():
+            for part in parts:
+                os.remove(part.tmp_path)
+        self.closed_parts = {}
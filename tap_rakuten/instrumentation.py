@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+import sys
+import json
+import time
+import threading
+import contextlib
+import singer
+import singer.metrics as metrics
+from collections import defaultdict
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+logger = singer.get_logger().getChild('tap-rakuten')
+
+STAGES = (
+    'request',
+    'download',
+    'parse',
+    'transform',
+    'validate',
+    'output'
+)
+
+
+def peak_memory():
+    """
+    Peak resident memory of the process in bytes, where available.
+    """
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    if sys.platform == 'darwin':
+        return maxrss
+    return maxrss * 1024
+
+
+class Stats():
+    """
+    Seconds spent per stage and counters (rows, bytes) of one unit of work,
+    such as a report window or a whole stream.
+    """
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    def add_time(self, stage, seconds):
+        self.seconds[stage] += seconds
+
+    def add_count(self, name, value=1):
+        self.counts[name] += value
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[stage] += time.perf_counter() - started
+
+    def merge(self, other):
+        for stage, seconds in other.seconds.items():
+            self.seconds[stage] += seconds
+        for name, value in other.counts.items():
+            self.counts[name] += value
+
+    def asdict(self):
+        return {
+            'seconds': {k: round(v, 6) for k, v in self.seconds.items()},
+            'counts': dict(self.counts)
+        }
+
+
+class Instrumentation():
+    """
+    Collects per-window and per-stream stage timings, byte counters and peak
+    memory samples and emits them as Singer metric messages. Totals for the
+    whole run can be written as a JSON summary at the end.
+
+    Timing every row has a cost, so nothing is measured unless enabled.
+
+    Args:
+        enabled (bool): collect and emit stage metrics
+        summary_path (string, optional): file to write the run summary to
+    """
+
+    def __init__(self, enabled=False, summary_path=None):
+        self.enabled = enabled
+        self.summary_path = summary_path
+        self.totals = defaultdict(Stats)
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def new_stats(self):
+        return Stats() if self.enabled else None
+
+    def emit(self, stats, tags):
+        for stage, seconds in stats.seconds.items():
+            metrics.log(logger, metrics.Point(
+                'timer', 'stage_duration', seconds, dict(tags, stage=stage)
+            ))
+
+        for name, value in stats.counts.items():
+            metrics.log(logger, metrics.Point('counter', name, value, tags))
+
+        memory = peak_memory()
+        if memory is not None:
+            metrics.log(logger, metrics.Point(
+                'gauge', 'peak_memory_bytes', memory, tags
+            ))
+
+    def record_window(self, tap_stream_id, start_date, end_date, stats):
+        """
+        Emit the metrics of a report window and add them to the stream totals.
+        """
+        if stats is None:
+            return
+
+        self.emit(stats, {
+            metrics.Tag.endpoint: tap_stream_id,
+            'start_date': start_date.strftime("%Y-%m-%d"),
+            'end_date': end_date.strftime("%Y-%m-%d")
+        })
+
+        with self._lock:
+            self.totals[tap_stream_id].merge(stats)
+
+    def record_stream(self, tap_stream_id, stats):
+        """
+        Emit the metrics measured for a whole stream, e.g. validation and
+        output, and add them to the stream totals.
+        """
+        if stats is None:
+            return
+
+        self.emit(stats, {metrics.Tag.endpoint: tap_stream_id})
+
+        with self._lock:
+            self.totals[tap_stream_id].merge(stats)
+
+    def summary(self):
+        with self._lock:
+            return {
+                'duration': round(time.time() - self.started, 3),
+                'peak_memory_bytes': peak_memory(),
+                'streams': {
+                    stream_id: stats.asdict()
+                    for stream_id, stats in self.totals.items()
+                }
+            }
+
+    def write_summary(self):
+        if not (self.enabled and self.summary_path):
+            return
+
+        with open(self.summary_path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+
+_instrumentation = Instrumentation()
+
+
+def get_instrumentation():
+    return _instrumentation
+
+
+def configure(config):
+    global _instrumentation
+    _instrumentation = Instrumentation(
+        enabled=config.get('stage_metrics', False),
+        summary_path=config.get('metrics_summary_path')
+    )
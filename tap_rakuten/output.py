@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+import sys
+import copy
+import queue
+import json
+import time
+import threading
+import singer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(message):
+    """
+    Serialize a message to a JSON line (bytes), using orjson when installed.
+    Messages orjson rejects, e.g. with integers beyond 64 bits, fall back to
+    the json module.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(message) + b'\n'
+        except TypeError:
+            pass
+    return (json.dumps(message, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+class MessageWriter():
+    """
+    Serializes Singer messages and writes them to stdout in large batches
+    instead of one write and flush per line.
+
+    The buffer is flushed whenever it exceeds `buffer_size` bytes and after
+    every STATE message, so a target always receives the records a state
+    covers before the state itself.
+
+    With `background`, flushed batches are written by a separate thread, so
+    serializing further messages overlaps with a target that is slow to read
+    stdout. At most `queue_size` batches wait for that thread before writers
+    block. An explicit flush() waits until everything has been written.
+
+    Args:
+        buffer_size (int): bytes to buffer before writing
+        omit_nulls (bool): leave null fields out of RECORD messages
+        stream (file, optional): binary file to write to, stdout by default
+        background (bool): write batches on a separate thread
+        queue_size (int): batches queued for the background thread
+    """
+
+    def __init__(self, buffer_size=1048576, omit_nulls=False, stream=None,
+                 background=False, queue_size=8):
+        self.buffer_size = buffer_size
+        self.omit_nulls = omit_nulls
+        self.stream = stream
+        self.buffer = []
+        self.buffered = 0
+        self.background = background
+        self.queue_size = queue_size
+        self._queue = None
+        self._error = None
+
+    def write(self, line):
+        self.buffer.append(line)
+        self.buffered += len(line)
+        if self.buffered >= self.buffer_size:
+            self.flush(wait=False)
+
+    def write_schema(self, stream_name, schema, key_properties):
+        self.write(dumps({
+            'type': 'SCHEMA',
+            'stream': stream_name,
+            'schema': schema,
+            'key_properties': key_properties
+        }))
+
+    def write_record(self, stream_name, record):
+        if self.omit_nulls:
+            record = {k: v for k, v in record.items() if v is not None}
+        self.write(dumps({
+            'type': 'RECORD',
+            'stream': stream_name,
+            'record': record
+        }))
+
+    def write_serialized(self, stream_name, records):
+        # RECORD messages serialized by a transform worker process
+        self.write(records.data)
+
+    def write_state(self, state):
+        self.write(dumps({'type': 'STATE', 'value': state}))
+        self.flush(wait=False)
+
+    def complete_window(self, stream_name, start_date, end_date):
+        # records were already written as RECORD messages
+        pass
+
+    def flush(self, wait=True):
+        """
+        Write the buffered messages. In the background, only wait for them to
+        be written when `wait` is set.
+        """
+        if self._error is not None:
+            raise self._error
+
+        if self.buffer:
+            data = b''.join(self.buffer)
+            self.buffer = []
+            self.buffered = 0
+
+            if not self.background:
+                self.write_data(data)
+                return
+
+            if self._queue is None:
+                self._queue = queue.Queue(self.queue_size)
+                threading.Thread(target=self.write_queued, daemon=True).start()
+            self._queue.put(data)
+
+        if wait and self._queue is not None:
+            self._queue.join()
+            if self._error is not None:
+                raise self._error
+
+    def write_queued(self):
+        while True:
+            data = self._queue.get()
+            try:
+                if self._error is None:
+                    self.write_data(data)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def write_data(self, data):
+        stream = self.stream
+        if stream is None:
+            stream = getattr(sys.stdout, 'buffer', None)
+        if stream is None:
+            # stdout replaced by a text stream, e.g. under test capture
+            sys.stdout.write(data.decode('utf-8'))
+            sys.stdout.flush()
+            return
+
+        stream.write(data)
+        stream.flush()
+
+
+# streams are synced on several threads; every message written to stdout and
+# every change to the shared state goes through this lock so lines never
+# interleave and STATE messages always serialize a consistent state
+_lock = threading.RLock()
+
+_writer = MessageWriter()
+
+
+def get_writer():
+    return _writer
+
+
+def set_writer(writer):
+    """
+    Replace the writer every message goes through. A writer implements
+    write_schema, write_record, write_serialized, write_state,
+    complete_window and flush like MessageWriter.
+    """
+    global _writer
+    with _lock:
+        _writer.flush()
+        _writer = writer
+
+
+def configure(config):
+    set_writer(MessageWriter(
+        buffer_size=int(config.get('output_buffer_size', 1048576)),
+        omit_nulls=config.get('omit_null_fields', False),
+        background=config.get('pipeline', False),
+        queue_size=int(config.get('pipeline_queue_size', 8))
+    ))
+
+
+def write_schema(stream_name, schema, key_properties):
+    with _lock:
+        _writer.write_schema(stream_name, schema, key_properties)
+
+
+def write_record(stream_name, record):
+    with _lock:
+        _writer.write_record(stream_name, record)
+
+
+def write_serialized(stream_name, records):
+    with _lock:
+        _writer.write_serialized(stream_name, records)
+
+
+def write_state(state):
+    with _lock:
+        # the state keeps changing after this call, so pluggable writers
+        # that hold on to messages get a snapshot
+        _writer.write_state(copy.deepcopy(state))
+
+
+def complete_window(stream_name, start_date, end_date):
+    """
+    Signal that every record of a report window has been written, just before
+    its bookmark is set.
+    """
+    with _lock:
+        _writer.complete_window(stream_name, start_date, end_date)
+
+
+def flush():
+    with _lock:
+        _writer.flush()
+
+
+def write_bookmark(state, tap_stream_id, key, value):
+    """
+    Set a bookmark and emit the resulting state as one atomic step. Nothing is
+    emitted when the bookmark already has this value.
+    """
+    write_bookmarks(state, tap_stream_id, {key: value})
+
+
+def write_bookmarks(state, tap_stream_id, values):
+    """
+    Set several bookmarks of a stream and emit the resulting state once.
+    """
+    with _lock:
+        if all(
+            singer.get_bookmark(state, tap_stream_id, key) == value
+            for key, value in values.items()
+        ):
+            return
+        for key, value in values.items():
+            singer.write_bookmark(state, tap_stream_id, key, value)
+        write_state(state)
+
+
+class StateHeartbeat():
+    """
+    Re-emits the current state every `records` records or `seconds` seconds,
+    whichever comes first, for targets that only flush on STATE messages.
+    Bookmark changes are always emitted immediately by write_bookmark, so the
+    heartbeat never changes what a resumed run starts from.
+
+    Args:
+        state (dict): state shared with the stream
+        records (int, optional): emit after this many records
+        seconds (float, optional): emit after this many seconds
+    """
+
+    def __init__(self, state, records=None, seconds=None):
+        self.state = state
+        self.records = records
+        self.seconds = seconds
+        self.count = 0
+        self.last_emit = time.time()
+
+    def tick(self, count=1):
+        if not (self.records or self.seconds):
+            return
+
+        self.count += count
+
+        if (self.records and self.count >= self.records) or (
+            self.seconds and time.time() - self.last_emit >= self.seconds
+        ):
+            write_state(self.state)
+            self.count = 0
+            self.last_emit = time.time()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+import queue
+import threading
+
+
+class Deferred():
+    """
+    A call made on the producer thread that has to run on the consumer
+    thread, in order with the items produced before it.
+    """
+
+    def __init__(self, fn, args):
+        self.fn = fn
+        self.args = args
+
+
+class Failure():
+
+    def __init__(self, error):
+        self.error = error
+
+
+class Stopped(Exception):
+    pass
+
+
+DONE = object()
+
+
+class Pipeline():
+    """
+    Runs a generator on a producer thread and hands its items to the consumer
+    through a bounded queue, so e.g. downloading and parsing a report overlaps
+    with validating and writing the rows already parsed. The producer blocks
+    once `queue_size` batches are waiting, which bounds memory when the
+    consumer is slow.
+
+    Items travel in batches of up to `batch_size` to keep the queue overhead
+    per row low. Calls that must happen in order with the items, such as
+    emitting the STATE covering them, are passed with `defer`.
+
+    Args:
+        queue_size (int): batches buffered ahead of the consumer
+        batch_size (int): items per batch
+    """
+
+    def __init__(self, queue_size=8, batch_size=1000):
+        self.queue_size = max(1, int(queue_size))
+        self.batch_size = max(1, int(batch_size))
+        self._local = threading.local()
+
+    @classmethod
+    def from_config(cls, config):
+        if not config.get('pipeline'):
+            return None
+        return cls(
+            queue_size=config.get('pipeline_queue_size', 8),
+            batch_size=config.get('pipeline_batch_size', 1000)
+        )
+
+    def defer(self, fn, *args):
+        """
+        Call fn once the consumer has received every item produced so far.
+        Outside of the producer thread fn is called right away.
+        """
+        batch = getattr(self._local, 'batch', None)
+        if batch is None:
+            fn(*args)
+            return
+        batch.append(Deferred(fn, args))
+        self._local.flush()
+
+    def run(self, iterable):
+        """
+        Iterate over `iterable` on a producer thread.
+
+        Yields:
+            item: the items of iterable, in order
+        """
+        items = queue.Queue(self.queue_size)
+        stop = threading.Event()
+
+        def put(item):
+            while True:
+                if stop.is_set():
+                    raise Stopped()
+                try:
+                    items.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        def produce():
+            local = self._local
+
+            def flush():
+                put(local.batch)
+                local.batch = []
+
+            local.batch = []
+            local.flush = flush
+
+            try:
+                for item in iterable:
+                    local.batch.append(item)
+                    if len(local.batch) >= self.batch_size:
+                        flush()
+                if local.batch:
+                    flush()
+                put(DONE)
+            except Stopped:
+                pass
+            except BaseException as e:
+                try:
+                    put(Failure(e))
+                except Stopped:
+                    pass
+            finally:
+                local.batch = None
+                close = getattr(iterable, 'close', None)
+                if close is not None:
+                    close()
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+
+        try:
+            while True:
+                batch = items.get()
+                if batch is DONE:
+                    return
+                if isinstance(batch, Failure):
+                    raise batch.error
+                for item in batch:
+                    if isinstance(item, Deferred):
+                        item.fn(*item.args)
+                    else:
+                        yield item
+        finally:
+            stop.set()
+            producer.join()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+import threading
+from datetime import timedelta
+
+
+class WindowPlanner():
+    """
+    Plans the date windows requested from the Rakuten API.
+
+    The reporting endpoint accepts a `start_date`/`end_date` range, so several
+    days can be downloaded with a single request. The planner starts with
+    `initial_days` per request and adapts the size of the next window to the
+    feedback of the previous ones: the window doubles while responses stay
+    small and fast, and halves after a slow, huge or failed response.
+    Feedback may be recorded from several worker threads at once.
+
+    Args:
+        initial_days (int): size of the first window
+        min_days (int): smallest window the planner will fall back to
+        max_days (int): largest window the planner will grow to
+        target_rows (int): preferred number of rows per response
+        slow_seconds (float): responses slower than this shrink the window
+    """
+
+    def __init__(self, initial_days=1, min_days=1, max_days=31,
+                 target_rows=50000, slow_seconds=60):
+        self.min_days = max(1, int(min_days))
+        self.max_days = max(self.min_days, int(max_days))
+        self.target_rows = target_rows
+        self.slow_seconds = slow_seconds
+        self.size = self.clamp(initial_days)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            initial_days=config.get('window_days', 1),
+            min_days=config.get('min_window_days', 1),
+            max_days=config.get('max_window_days', 31),
+            target_rows=config.get('window_target_rows', 50000),
+            slow_seconds=config.get('window_slow_seconds', 60)
+        )
+
+    def clamp(self, days):
+        return min(self.max_days, max(self.min_days, int(days)))
+
+    def next_window(self, start_date, last_date):
+        """
+        Get the next window starting at start_date, bounded by last_date.
+
+        Args:
+            start_date (datetime.datetime): first day of the window
+            last_date (datetime.datetime): last day that may be requested
+
+        Returns:
+            window (tuple): (start_date, end_date), both inclusive
+        """
+        end_date = min(start_date + timedelta(self.size - 1), last_date)
+        return (start_date, end_date)
+
+    def previous_window(self, end_date, first_date):
+        """
+        Get the window ending at end_date, bounded by first_date, for planning
+        backwards from the most recent day.
+
+        Args:
+            end_date (datetime.datetime): last day of the window
+            first_date (datetime.datetime): first day that may be requested
+
+        Returns:
+            window (tuple): (start_date, end_date), both inclusive
+        """
+        start_date = max(end_date - timedelta(self.size - 1), first_date)
+        return (start_date, end_date)
+
+    def record(self, days, rows, seconds):
+        """
+        Adapt the window size after a successful response.
+
+        Args:
+            days (int): number of days covered by the response
+            rows (int): number of rows returned
+            seconds (float): time taken to download and process the response
+        """
+        with self._lock:
+            if rows > self.target_rows * 2 or seconds > self.slow_seconds:
+                self.size = self.clamp(days // 2)
+                return
+
+            if rows < self.target_rows and seconds < self.slow_seconds / 2:
+                size = days * 2
+                if rows:
+                    # don't grow past the projected target row count
+                    rows_per_day = rows / days
+                    size = min(size, self.target_rows // rows_per_day)
+                self.size = self.clamp(max(size, days))
+
+    def record_failure(self, days):
+        """
+        Shrink the window after a failed response.
+
+        Args:
+            days (int): number of days covered by the failed request
+
+        Returns:
+            retry (bool): whether a smaller window is available to retry with
+        """
+        with self._lock:
+            self.size = self.clamp(days // 2)
+        return days > self.min_days
+
+
+def merge_ranges(ranges):
+    """
+    Merge overlapping and adjacent day ranges.
+
+    Args:
+        ranges (list): (first_day, last_day) pairs, both inclusive
+
+    Returns:
+        ranges (list): sorted, disjoint [first_day, last_day] pairs
+    """
+    merged = []
+
+    for first, last in sorted(tuple(r) for r in ranges):
+        if merged and first <= merged[-1][1] + timedelta(1):
+            merged[-1][1] = max(merged[-1][1], last)
+        else:
+            merged.append([first, last])
+
+    return merged
+
+
+def get_gaps(ranges, first_date, last_date):
+    """
+    Get the day ranges between first_date and last_date that no range covers.
+
+    Args:
+        ranges (list): merged ranges, see merge_ranges
+        first_date (datetime.datetime): first day
+        last_date (datetime.datetime): last day
+
+    Returns:
+        gaps (list): sorted (first_day, last_day) pairs
+    """
+    gaps = []
+    date = first_date
+
+    for first, last in ranges:
+        if last < date:
+            continue
+        if first > last_date:
+            break
+        if first > date:
+            gaps.append((date, first - timedelta(1)))
+        date = last + timedelta(1)
+
+    if date <= last_date:
+        gaps.append((date, last_date))
+
+    return gaps
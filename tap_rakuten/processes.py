@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+import io
+import os
+import csv
+import json
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from tap_rakuten.output import dumps
+
+
+class SerializedRecords():
+    """
+    RECORD messages of a chunk of report rows, already serialized by a worker
+    process as JSON lines.
+
+    Args:
+        data (bytes): one RECORD message per line
+        count (int): number of records
+    """
+
+    def __init__(self, data, count):
+        self.data = data
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def to_records(self):
+        return [
+            json.loads(line)['record'] for line in self.data.splitlines()
+        ]
+
+
+def split_csv_chunks(lines, chunk_rows=5000):
+    """
+    Group CSV text lines into chunks of about `chunk_rows` complete records.
+    A line with an odd number of quote characters opens or closes a quoted
+    value spanning several lines, so chunks only end where the quote count
+    so far is even.
+
+    Yields:
+        text (string): CSV text without a header
+    """
+    chunk = []
+    rows = 0
+    quoted = False
+
+    for line in lines:
+        chunk.append(line)
+        if line.count('"') % 2:
+            quoted = not quoted
+        if quoted:
+            continue
+
+        rows += 1
+        if rows >= chunk_rows:
+            yield ''.join(chunk)
+            chunk = []
+            rows = 0
+
+    if chunk:
+        yield ''.join(chunk)
+
+
+@lru_cache(maxsize=32)
+def get_transformer(header, exclude):
+    # imported here, the worker processes only need it for the column map
+    from tap_rakuten.client import Rakuten
+    return Rakuten(token=None).compile_transformer(list(header), set(exclude))
+
+
+def transform_chunk(header, exclude, text, serialize=None):
+    """
+    Parse and transform a chunk of CSV text in a worker process.
+
+    Args:
+        header (tuple): raw CSV column names
+        exclude (frozenset): output field names to leave out
+        text (string): CSV rows
+        serialize (dict, optional): `stream` name and `omit_nulls` flag to
+            return RECORD messages instead of rows
+
+    Returns:
+        rows (list or SerializedRecords): transformed rows in order
+    """
+    transformer = get_transformer(header, exclude)
+    rows = [
+        transformer(row)
+        for row in csv.reader(io.StringIO(text, newline=''))
+        # csv.reader yields empty lists for blank lines
+        if row
+    ]
+
+    if serialize is None:
+        return rows
+
+    stream = serialize['stream']
+    omit_nulls = serialize.get('omit_nulls', False)
+
+    return SerializedRecords(
+        b''.join(
+            dumps({
+                'type': 'RECORD',
+                'stream': stream,
+                'record': (
+                    {k: v for k, v in row.items() if v is not None}
+                    if omit_nulls else row
+                )
+            })
+            for row in rows
+        ),
+        len(rows)
+    )
+
+
+class TransformPool():
+    """
+    Process pool parsing and transforming report rows on every core. The
+    report text is shipped to the workers in chunks of `chunk_rows` rows and
+    results are yielded in report order. At most `max_pending` chunks are in
+    flight at once.
+
+    Args:
+        processes (int, optional): worker processes, the number of CPUs by
+            default
+        chunk_rows (int): rows per chunk
+        max_pending (int, optional): chunks in flight, twice the number of
+            processes by default
+    """
+
+    def __init__(self, processes=None, chunk_rows=5000, max_pending=None):
+        self.processes = processes or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers=self.processes)
+        self.chunk_rows = int(chunk_rows)
+        self.max_pending = max_pending or 2 * self.processes
+
+    @classmethod
+    def from_config(cls, config):
+        processes = config.get('transform_processes')
+        if not processes:
+            return None
+        return cls(
+            processes=None if processes == 'auto' else int(processes),
+            chunk_rows=config.get('transform_chunk_rows', 5000)
+        )
+
+    def map(self, lines, header, exclude=None, serialize=None):
+        """
+        Transform the rows following the header of a report.
+
+        Args:
+            lines (iterable): CSV text lines after the header
+            header (list): raw CSV column names
+            exclude (set, optional): output field names to leave out
+            serialize (dict, optional): see transform_chunk
+
+        Yields:
+            row (dict or SerializedRecords): a transformed row, or a chunk of
+                serialized records
+        """
+        header = tuple(header)
+        exclude = frozenset(exclude or ())
+        pending = deque()
+
+        def results(future):
+            result = future.result()
+            if isinstance(result, SerializedRecords):
+                if result.count:
+                    yield result
+            else:
+                yield from result
+
+        try:
+            for text in split_csv_chunks(lines, self.chunk_rows):
+                pending.append(self.executor.submit(
+                    transform_chunk, header, exclude, text, serialize
+                ))
+                if len(pending) >= self.max_pending:
+                    yield from results(pending.popleft())
+
+            while pending:
+                yield from results(pending.popleft())
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def shutdown(self):
+        self.executor.shutdown(cancel_futures=True)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+import time
+import threading
+
+
+class RateLimiter():
+    """
+    Token bucket limiting the rate of requests of a client. A single limiter
+    is shared by every worker and stream, so all of its methods are safe to
+    call from several threads.
+
+    Tokens are reserved under the lock and waited for outside of it, so
+    concurrent callers queue up in order instead of waking up together.
+
+    Args:
+        rate (float, optional): requests per second, unlimited if not set
+        burst (int): number of requests that may be made back to back
+    """
+
+    def __init__(self, rate=None, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Block until a request may be made.
+        """
+        with self._lock:
+            now = time.monotonic()
+            # tokens only refill once a pause is over
+            start = max(now, self._paused_until)
+            wait = start - now
+
+            if self.rate:
+                self._refill(start)
+                self._tokens -= 1
+                if self._tokens < 0:
+                    wait += -self._tokens / self.rate
+
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """
+        Hold back every request for the given number of seconds, e.g. as
+        instructed by a `Retry-After` header. No tokens are added while the
+        limiter is paused, so queued requests resume at `rate` afterwards.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._updated = max(self._updated, self._paused_until)
+
+    def _refill(self, now):
+        if now > self._updated:
+            if self.rate:
+                self._tokens = min(
+                    self.burst,
+                    self._tokens + (now - self._updated) * self.rate
+                )
+            self._updated = now
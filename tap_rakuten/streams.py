@@ -1,9 +1,74 @@
 #!/usr/bin/env python
+import time
+import threading
 import singer
+import requests
+from tap_rakuten.cache import (
+    FingerprintIndex, MemoryFingerprintIndex, fingerprint
+)
+from tap_rakuten.client import APIException, RateLimitException
+from tap_rakuten.pipeline import Deferred, Pipeline
+from tap_rakuten.planner import WindowPlanner, merge_ranges, get_gaps
+from tap_rakuten.processes import SerializedRecords
+from tap_rakuten.sync import get_excluded_fields, is_compiled_schema
+from tap_rakuten import output
+from tap_rakuten import instrumentation
 from tap_rakuten.utilities import to_utc, report_slug_to_name
 from singer import metadata
 from singer import utils
+from singer.schema import Schema
 from datetime import datetime, timedelta
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = singer.get_logger().getChild('tap-rakuten')
+
+DAY_FMT = '%Y-%m-%d'
+
+# read once for the client, output and process pool shared by all reports
+CLIENT_CONFIG_KEYS = frozenset([
+    'token',
+    'region',
+    'cache_dir',
+    'schema_cache_ttl',
+    'response_cache',
+    'response_cache_trust_days',
+    'replay',
+    'request_timeout',
+    'requests_per_second',
+    'request_burst',
+    'max_retries',
+    'read_buffer_size',
+    'spool_dir',
+    'spool_max_bytes',
+    'spool_keep',
+    'pipeline',
+    'pipeline_queue_size',
+    'transform_processes',
+    'transform_chunk_rows',
+    'output_buffer_size',
+    'omit_null_fields',
+    'export',
+    'stage_metrics',
+    'metrics_summary_path',
+    'parallel_streams',
+    'backfill',
+    'reports'
+])
+
+WINDOW_EXCEPTIONS = (
+    APIException,
+    RateLimitException,
+    requests.exceptions.RequestException
+)
+
+
+def start_of_day(dtime):
+    return to_utc(datetime.combine(dtime.date(), datetime.min.time()))
+
+
+def to_day(string):
+    return to_utc(datetime.strptime(string, DAY_FMT))
 
 
 class Stream():
@@ -15,20 +80,168 @@ class Stream():
 
     stream = None
 
+    columns = None
+
     def __init__(self, client, stream_config):
         self.name = stream_config.get('report_slug')
         self.tap_stream_id = report_slug_to_name(self.name)
         self.client = client
         self.utcnow = utils.now()
         self.start_date = stream_config.get('start_date')
+        # optional last day to sync, yesterday by default
+        self.end_date = stream_config.get('end_date')
+        # sync the most recent days first, then fill history backwards
+        self.recency_first = stream_config.get('recency_first', False)
+        # replayed windows follow the ranges in the response cache
+        self.replay = stream_config.get('replay', False)
         self.date_type = stream_config.get('date_type')
+        self.planner = WindowPlanner.from_config(stream_config)
+        self.workers = int(stream_config.get('workers', 1))
+        self.state_interval_records = stream_config.get('state_interval_records')
+        self.state_interval_seconds = stream_config.get('state_interval_seconds')
+        self.fast_transform = stream_config.get('fast_transform', False)
+        self._header_lock = threading.Lock()
+        # rows and deferred calls of the window a worker thread is fetching
+        self._local = threading.local()
+        self._failed_calls = {}
+
+        # the last `lookback_days` complete days are re-synced on every run
+        self.lookback_days = int(stream_config.get('lookback_days', 0))
+        self.lookback_start = None
+        self.fingerprints = None
+        self._window_fingerprints = {}
+        self.excluded_fields = None
+
+        # exported files are partitioned by report day
+        self.export = bool(stream_config.get('export'))
+
+        # downloads and parsing run ahead of validation and output
+        self.pipeline = Pipeline.from_config(stream_config)
+
+        self.omit_null_fields = stream_config.get('omit_null_fields', False)
+
+        if self.lookback_days:
+            self.lookback_start = to_utc(datetime.combine(
+                self.utcnow.date(), datetime.min.time()
+            )) - timedelta(self.lookback_days)
+
+            if self.start_date:
+                # the lookback never reaches before the start date
+                self.lookback_start = max(
+                    self.lookback_start,
+                    start_of_day(utils.strptime_with_tz(self.start_date))
+                )
+
+            if stream_config.get('cache_dir'):
+                self.fingerprints = FingerprintIndex(
+                    stream_config['cache_dir'],
+                    self.tap_stream_id
+                )
+
+        # the current day is re-fetched every `poll_interval` seconds
+        self.poll_interval = stream_config.get('poll_interval')
+        self.poll_duration = stream_config.get('poll_duration')
+        self.poll_fingerprints = None
+
+        if self.poll_interval:
+            if self.fingerprints:
+                # a polled day is a lookback day of the next run
+                self.poll_fingerprints = self.fingerprints
+            elif stream_config.get('cache_dir'):
+                self.poll_fingerprints = FingerprintIndex(
+                    stream_config['cache_dir'],
+                    self.tap_stream_id
+                )
+            else:
+                self.poll_fingerprints = MemoryFingerprintIndex()
 
     def load_schema(self):
-        self.set_schema(self.client.get_schema(self.name))
+        self.columns = self.client.get_columns(self.name)
+        self.set_schema(self.client.infer_schema(self.columns))
+
+    def check_header(self, columns):
+        """
+        Compare the header of a report response with the known columns. The
+        schema cache is refreshed when they differ, and a new SCHEMA message
+        is emitted when the resulting fields differ from the stream's schema.
+        """
+        columns = [c.strip() for c in columns]
+
+        with self._header_lock:
+            if columns == self.columns:
+                return
+
+            if self.columns is None:
+                self.columns = self.client.get_cached_columns(self.name)
+                if columns == self.columns:
+                    return
+
+            self.columns = columns
+            self.client.cache_columns(self.name, columns)
+
+            if self.stream is None:
+                return
+
+            schema = self.client.infer_schema(columns)
+            current = self.stream.schema.to_dict()
+
+            if set(schema['properties']) == set(current.get('properties', {})):
+                return
+
+            logger.info("%s: report columns changed, emitting new schema",
+                        self.tap_stream_id)
+
+            self.defer(self.replace_schema, schema)
+
+    def replace_schema(self, schema):
+        """
+        Replace the catalog schema of the stream and emit it as a new SCHEMA.
+        """
+        self.set_schema(schema)
+        self.stream.schema = Schema.from_dict(schema)
+
+        output.write_schema(
+            self.tap_stream_id,
+            schema,
+            metadata.get(
+                metadata.to_map(self.stream.metadata),
+                (),
+                'table-key-properties'
+            )
+        )
+
+    def get_compiled_schema(self):
+        """
+        Get the schema of the rows the column transforms produce for the
+        report columns, the cached columns before the first response. None
+        while the columns are unknown.
+        """
+        columns = self.columns
+        if columns is None:
+            columns = self.client.get_cached_columns(self.name)
+        if columns is None:
+            return None
+        return self.client.infer_schema(columns)
 
     def set_schema(self, schema):
         self.schema = schema
 
+    def defer(self, fn, *args):
+        """
+        Call fn in order with the rows yielded so far. With a pipeline, rows
+        are still queued for output when the report is done with them, so
+        schema changes and bookmarks wait for the consumer to catch up. On a
+        worker thread of sync_concurrent, fn is kept with the rows of the
+        window being fetched and called when that window is emitted.
+        """
+        window_items = getattr(self._local, 'items', None)
+        if window_items is not None:
+            window_items.append(Deferred(fn, args))
+        elif self.pipeline is None:
+            fn(*args)
+        else:
+            self.pipeline.defer(fn, *args)
+
     def iterdates(self, start_date):
         # set to start of day
         date = to_utc(
@@ -90,33 +303,550 @@ class Stream():
     def get_bookmark(self, state):
         return singer.get_bookmark(state, self.tap_stream_id, "last_sync")
 
+    def commit_window(self, window):
+        """
+        Commit the row fingerprints of an emitted window and let the writer
+        finish its output, e.g. exported files.
+        """
+        fingerprints = self._window_fingerprints.pop(window, None)
+        if fingerprints is not None:
+            index, fingerprints = fingerprints
+            index.save(window[0], fingerprints)
+
+        output.complete_window(self.tap_stream_id, *window)
+
+    def get_completed_ranges(self, state):
+        """
+        Get the day ranges a recency first sync has completed. A bookmark from
+        a date ordered sync covers every day from the start date up to it.
+
+        Returns:
+            ranges (list): merged [first_day, last_day] pairs
+        """
+        ranges = singer.get_bookmark(
+            state, self.tap_stream_id, 'completed_ranges'
+        )
+
+        if ranges is not None:
+            return [[to_day(first), to_day(last)] for first, last in ranges]
+
+        bookmark = singer.get_bookmark(state, self.tap_stream_id, 'last_sync')
+        if bookmark:
+            return [[
+                start_of_day(utils.strptime_with_tz(self.start_date)),
+                start_of_day(utils.strptime_with_tz(bookmark))
+            ]]
+
+        return []
+
+    def write_completed_range(self, state, window):
+        """
+        Add a window to the completed ranges. `last_sync` follows the range
+        that begins at the start date, so it still marks the day up to which
+        every day is done.
+        """
+        ranges = merge_ranges(self.get_completed_ranges(state) + [window])
+
+        values = {
+            'completed_ranges': [
+                [first.strftime(DAY_FMT), last.strftime(DAY_FMT)]
+                for first, last in ranges
+            ]
+        }
+
+        start = start_of_day(utils.strptime_with_tz(self.start_date))
+        bookmark = self.get_bookmark(state)
+        first, last = ranges[0]
+        if first <= start and not (
+            bookmark and utils.strptime_with_tz(bookmark) >= last
+        ):
+            values['last_sync'] = utils.strftime(last)
+
+        output.write_bookmarks(state, self.tap_stream_id, values)
+
+    def write_bookmark(self, state, window):
+        """
+        Record a window as emitted: commit it and move the bookmark to its
+        last day. Re-synced lookback days never move the bookmark backwards.
+        """
+        self.commit_window(window)
+
+        if self.recency_first:
+            self.write_completed_range(state, window)
+            return
+
+        bookmark = self.get_bookmark(state)
+        if bookmark and utils.strptime_with_tz(bookmark) >= window[1]:
+            return
+
+        # the bookmark is the last day of the completed window
+        output.write_bookmark(
+            state,
+            self.tap_stream_id,
+            "last_sync",
+            utils.strftime(window[1])
+        )
+
+    def next_window(self, start_date, last_date):
+        """
+        Plan the next window. Lookback days are requested one day at a time,
+        so their rows can be compared with the previous run's fingerprints.
+        Exports request every day on its own, one window per partition.
+        """
+        if self.export:
+            return (start_date, start_date)
+
+        if self.lookback_start is not None:
+            if start_date >= self.lookback_start:
+                return (start_date, start_date)
+            last_date = min(last_date, self.lookback_start - timedelta(1))
+
+        if self.replay:
+            window = self.get_replay_window(start_date, last_date)
+            if window is not None:
+                return window
+
+        return self.planner.next_window(start_date, last_date)
+
+    def previous_window(self, end_date, first_date):
+        """
+        Plan the window ending at end_date, like next_window plans forwards.
+        """
+        if self.export:
+            return (end_date, end_date)
+
+        if self.lookback_start is not None and end_date >= self.lookback_start:
+            return (end_date, end_date)
+
+        if self.replay:
+            window = self.get_replay_window(first_date, end_date, reverse=True)
+            if window is not None:
+                return window
+
+        return self.planner.previous_window(end_date, first_date)
+
+    def get_replay_window(self, start_date, last_date, reverse=False):
+        """
+        Plan a replayed window as one of the cached ranges, whatever size the
+        planner would pick now. None when no cached range fits.
+        """
+        window = self.client.get_cached_window(
+            self.name,
+            start_date,
+            last_date,
+            reverse=reverse,
+            date_type=self.date_type
+        )
+        if window is None:
+            return None
+        return (to_day(window[0]), to_day(window[1]))
+
+    def take_window(self, start_date, last_date, reverse=False):
+        """
+        Plan a window of the range from start_date to last_date, from its
+        start or, with reverse, from its end.
+
+        Returns:
+            window (tuple): (start_date, end_date), both inclusive
+            remaining (tuple): (start_date, last_date) of the rest of the range
+        """
+        if reverse:
+            window = self.previous_window(last_date, start_date)
+            return window, (start_date, window[0] - timedelta(1))
+
+        window = self.next_window(start_date, last_date)
+        return window, (window[1] + timedelta(1), last_date)
+
+    def log_window_failure(self, window, error):
+        days = (window[1] - window[0]).days + 1
+        if not self.planner.record_failure(days):
+            raise error
+        logger.warning(
+            "%s: %s day window from %s failed (%s), retrying with "
+            "%s day window", self.tap_stream_id, days,
+            utils.strftime(window[0]), error, self.planner.size
+        )
+
     def sync(self, state):
+        yield from self.sync_days(state)
+
+        if self.poll_interval and not self.end_date:
+            yield from self.poll()
+
+    def sync_days(self, state):
         bookmark = self.get_bookmark(state)
 
-        if not bookmark:
+        if not bookmark or self.recency_first:
+            # a recency first sync finds its gaps in the completed ranges
             bookmark = self.start_date
 
         start = utils.strptime_with_tz(bookmark)
 
-        for start_date in self.iterdates(start):
+        if self.stream is not None:
+            # deselected columns are never parsed or converted
+            self.excluded_fields = get_excluded_fields(
+                self.stream.schema.to_dict(),
+                metadata.to_map(self.stream.metadata)
+            )
+
+        if self.lookback_start is not None:
+            start = min(start, self.lookback_start)
+            if self.fingerprints:
+                self.fingerprints.prune(self.lookback_start)
+
+        dates = list(self.iterdates(start))
+
+        if self.end_date:
+            end = utils.strptime_with_tz(self.end_date)
+            dates = [d for d in dates if d <= end]
+
+        if not dates:
+            return
+
+        if self.recency_first:
+            yield from self.sync_recent_first(state, dates[0], dates[-1])
+        elif self.workers > 1:
+            yield from self.sync_concurrent(state, dates[0], dates[-1])
+        else:
+            yield from self.sync_sequential(state, dates[0], dates[-1])
+
+    def sync_recent_first(self, state, first_date, last_date):
+        """
+        Sync the days missing from the completed ranges, the most recent gap
+        first and every gap from its last day backwards. Lookback days are
+        always synced again.
+        """
+        completed = self.get_completed_ranges(state)
+
+        if self.lookback_start is not None:
+            completed = [
+                [first, min(last, self.lookback_start - timedelta(1))]
+                for first, last in completed
+                if first < self.lookback_start
+            ]
+
+        gaps = get_gaps(completed, first_date, last_date)
+
+        for gap_start, gap_end in reversed(gaps):
+            if self.workers > 1:
+                yield from self.sync_concurrent(
+                    state, gap_start, gap_end, reverse=True
+                )
+            else:
+                yield from self.sync_sequential(
+                    state, gap_start, gap_end, reverse=True
+                )
+
+    def sync_sequential(self, state, start_date, last_date, reverse=False):
+        """
+        Download windows one after another, streaming rows as they are parsed.
+        A window is only retried with fewer days when it fails before its
+        first row; a failure partway through the rows fails the stream.
+        """
+        while start_date <= last_date:
+            window, remaining = self.take_window(start_date, last_date, reverse)
+            emitted = False
+
+            try:
+                for item in self.sync_window(*window):
+                    emitted = True
+                    yield (self.stream, item)
+            except WINDOW_EXCEPTIONS as e:
+                if emitted:
+                    # a retry would emit the rows already yielded again; the
+                    # bookmark still points before this window
+                    raise
+                self.log_window_failure(window, e)
+                continue
+
+            self.defer(self.write_bookmark, state, window)
 
-            for item in self.client.report(
-                self.name,
-                start_date=start_date,
-                date_type=self.date_type
-            ):
-                yield (self.stream, item)
+            start_date, last_date = remaining
 
-            singer.write_bookmark(
-                state,
-                self.tap_stream_id,
-                "last_sync",
-                utils.strftime(start_date)
+    def poll(self):
+        """
+        Re-fetch the current day every `poll_interval` seconds until it ends,
+        or for `poll_duration` seconds, and yield the rows that are new or
+        changed since the previous poll. Unchanged responses are skipped
+        before parsing. The current day is never bookmarked; the next run
+        syncs it as a complete day.
+        """
+        interval = float(self.poll_interval)
+        today = start_of_day(utils.now())
+        deadline = today + timedelta(1)
+        if self.poll_duration:
+            deadline = min(
+                deadline,
+                utils.now() + timedelta(seconds=float(self.poll_duration))
             )
-            singer.write_state(state)
 
+        if self.poll_fingerprints is not self.fingerprints:
+            self.poll_fingerprints.prune(today)
+
+        window = (today, today)
+        validators = {}
+
+        while True:
+            started = time.time()
+            # only a poll that was emitted completely replaces the validators
+            attempt = dict(validators)
+
+            try:
+                for item in self.sync_window(*window, validators=attempt):
+                    yield (self.stream, item)
+            except WINDOW_EXCEPTIONS as e:
+                logger.warning("%s: poll of %s failed (%s)", self.tap_stream_id,
+                               today.strftime(DAY_FMT), e)
+            else:
+                validators = attempt
+                if not attempt['changed']:
+                    logger.info("%s: %s unchanged since the previous poll",
+                                self.tap_stream_id, today.strftime(DAY_FMT))
+                self.defer(self.complete_poll, window)
+
+            wait = max(0, interval - (time.time() - started))
+            if utils.now() + timedelta(seconds=wait) >= deadline:
+                return
+            time.sleep(wait)
+
+    def complete_poll(self, window):
+        # the polled rows are written now, not with the next bookmark
+        self.commit_window(window)
+        output.flush()
+
+    def sync_concurrent(self, state, start_date, last_date, reverse=False):
+        """
+        Download up to `workers` windows at once. Windows are emitted in the
+        order they were planned, so the bookmark only ever advances past days
+        whose predecessors have all been emitted. Rows of in-flight windows
+        are held in memory.
+        """
+        pending = deque()
+
+        def submit(window):
+            pending.append(
+                (window, executor.submit(self.fetch_window, *window))
+            )
+
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+
+        try:
+            while pending or start_date <= last_date:
+                while len(pending) < self.workers and start_date <= last_date:
+                    window, (start_date, last_date) = self.take_window(
+                        start_date, last_date, reverse
+                    )
+                    submit(window)
+
+                window, future = pending.popleft()
+
+                try:
+                    items = future.result()
+                except WINDOW_EXCEPTIONS as e:
+                    for call in self._failed_calls.pop(window, ()):
+                        self.defer(call.fn, *call.args)
+                    self.log_window_failure(window, e)
+                    # re-plan the failed range ahead of the windows in flight
+                    in_flight = list(pending)
+                    pending.clear()
+                    retry_date = window[0]
+                    while retry_date <= window[1]:
+                        retry = self.next_window(retry_date, window[1])
+                        submit(retry)
+                        retry_date = retry[1] + timedelta(1)
+                    pending.extend(in_flight)
+                    continue
+
+                for item in items:
+                    if isinstance(item, Deferred):
+                        # e.g. a schema change found by the worker
+                        self.defer(item.fn, *item.args)
+                    else:
+                        yield (self.stream, item)
+
+                self.defer(self.write_bookmark, state, window)
+        finally:
+            for _, future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def filter_unchanged(self, start_date, end_date, items, index=None):
+        """
+        Suppress rows whose fingerprint was already emitted for this day by a
+        previous run or poll. The new fingerprints are only committed once the
+        window has been emitted, see write_bookmark.
+        """
+        index = index or self.fingerprints
+        previous = index.load(start_date)
+        current = set()
+        suppressed = 0
+
+        for item in items:
+            digest = fingerprint(item)
+            current.add(digest)
+            if digest in previous:
+                suppressed += 1
+                continue
+            yield item
+
+        self._window_fingerprints[(start_date, end_date)] = (index, current)
+
+        if suppressed:
+            logger.info("%s: %s unchanged rows suppressed for %s",
+                        self.tap_stream_id, suppressed,
+                        start_date.strftime("%Y-%m-%d"))
+
+    def get_serialize_options(self):
+        """
+        Let transform worker processes serialize RECORD messages themselves,
+        when records need neither validation nor fingerprints and are written
+        to stdout.
+        """
+        if self.client.transform_pool is None or not self.fast_transform:
+            return None
+        if self.fingerprints is not None or self.export:
+            return None
+        if self.stream is None or not is_compiled_schema(
+            self.stream.schema.to_dict(),
+            self.get_compiled_schema()
+        ):
+            return None
+        return {
+            'stream': self.tap_stream_id,
+            'omit_nulls': self.omit_null_fields
+        }
+
+    def get_serialized_exclude(self):
+        """
+        Get the fields to leave out of records serialized by worker processes:
+        the deselected ones, and the ones the report has but the catalog
+        schema doesn't, which the Transformer would otherwise drop.
+        """
+        compiled = self.get_compiled_schema()
+        cataloged = self.stream.schema.to_dict().get('properties', {})
+        return set(self.excluded_fields or ()) | (
+            set(compiled['properties']) - set(cataloged)
+        )
+
+    def fetch_window(self, start_date, end_date):
+        """
+        Fetch the rows of a window on a worker thread. Calls deferred while
+        it runs are kept in order with its rows, see defer.
+        """
+        self._local.items = items = []
+        try:
+            for item in self.sync_window(start_date, end_date):
+                items.append(item)
+        except BaseException:
+            # the rows are dropped, but a schema change still applies
+            self._failed_calls[(start_date, end_date)] = [
+                item for item in items if isinstance(item, Deferred)
+            ]
+            raise
+        finally:
+            self._local.items = None
+        return items
+
+    def sync_window(self, start_date, end_date, validators=None):
+        """
+        Yield the rows of a single window and feed the response size and
+        timing back to the window planner. A poll passes the `validators` of
+        its previous response, see Rakuten.fetch_if_changed, and only gets
+        new or changed rows. The planner is only charged for the time spent
+        requesting, downloading and parsing, not for the time the consumer
+        holds on to a row, so a slow target never shrinks the windows.
+        """
+        seconds = 0.0
+        rows = 0
+
+        metrics = instrumentation.get_instrumentation()
+        stats = metrics.new_stats()
+
+        index = None
+        if validators is not None:
+            index = self.poll_fingerprints
+        elif self.fingerprints and self.lookback_start is not None \
+                and start_date >= self.lookback_start:
+            index = self.fingerprints
+
+        serialize = None if index else self.get_serialize_options()
+        exclude = self.excluded_fields
+        if serialize is not None:
+            exclude = self.get_serialized_exclude()
+
+        items = self.client.report(
+            self.name,
+            start_date=start_date,
+            end_date=end_date,
+            date_type=self.date_type,
+            on_header=self.check_header,
+            stats=stats,
+            exclude=exclude,
+            serialize=serialize,
+            validators=validators
+        )
+
+        if index is not None:
+            items = self.filter_unchanged(start_date, end_date, items, index)
+
+        resumed = time.time()
+
+        for item in items:
+            seconds += time.time() - resumed
+            rows += len(item) if isinstance(item, SerializedRecords) else 1
+            yield item
+            resumed = time.time()
+
+        seconds += time.time() - resumed
+
+        if validators is not None and not validators['changed']:
+            # an unchanged response has no rows, keep the fingerprints
+            self._window_fingerprints.pop((start_date, end_date), None)
+
+        self.planner.record(
+            (end_date - start_date).days + 1,
+            rows,
+            seconds
+        )
+
+        metrics.record_window(self.tap_stream_id, start_date, end_date, stats)
+
+
+def get_stream(client, config, stream_class=Stream):
+
+    return stream_class(client, config)
+
+
+def check_reports_config(config):
+    """
+    Reject the client-level keys, see CLIENT_CONFIG_KEYS, within the entries
+    of the `reports` config list.
+    """
+    for report in config.get('reports') or []:
+        keys = sorted(CLIENT_CONFIG_KEYS.intersection(report))
+        if keys:
+            raise Exception(
+                "Config keys {} of report {} can only be set at the top "
+                "level".format(', '.join(keys), report.get('report_slug'))
+            )
+
+
+def get_streams(client, config, stream_class=Stream):
+    """
+    Get a stream for every report in the `reports` config list. Each report
+    inherits the top-level configuration and may override the stream
+    settings, e.g. `start_date` or `date_type`. The settings of the shared
+    client, output and process pool, see CLIENT_CONFIG_KEYS, are only read
+    from the top level and rejected within a report. Falls back to the single
+    top-level `report_slug` when no list is configured.
+    """
+    check_reports_config(config)
 
+    reports = config.get('reports') or [{}]
 
-def get_stream(client, config):
+    defaults = {k: v for k, v in config.items() if k != 'reports'}
 
-    return Stream(client, config)
+    return [
+        get_stream(client, {**defaults, **report}, stream_class)
+        for report in reports
+    ]
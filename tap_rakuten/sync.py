@@ -1,32 +1,177 @@
 #!/usr/bin/env python
+import time
 import singer
 import singer.metrics as metrics
 from singer import metadata
 from singer import Transformer
+from tap_rakuten import output
+from tap_rakuten import instrumentation
+from tap_rakuten.processes import SerializedRecords
 
 logger = singer.get_logger().getChild('tap-rakuten')
 
+def get_selected_fields(schema, mdata):
+    """
+    Get the names of the schema properties that survive the catalog field
+    selection, following the same rules as singer's Transformer.
+    """
+    selected = set()
+
+    for field_name in schema.get('properties', {}):
+        breadcrumb = ('properties', field_name)
+        inclusion = metadata.get(mdata, breadcrumb, 'inclusion')
+
+        if inclusion != 'automatic' and (
+            metadata.get(mdata, breadcrumb, 'selected') is False
+            or inclusion == 'unsupported'
+        ):
+            continue
+
+        selected.add(field_name)
+
+    return selected
+
+
+def get_excluded_fields(schema, mdata):
+    """
+    Get the names of the schema properties deselected in the catalog. Columns
+    that are new to the schema are not excluded.
+    """
+    return set(schema.get('properties', {})) - get_selected_fields(
+        schema,
+        mdata
+    )
+
+
+def is_compiled_schema(schema, compiled):
+    """
+    Whether every property of the catalog schema has exactly the type and
+    format the column transforms produce for it, in which case Transformer
+    validation can be skipped. Properties the report doesn't have never
+    appear in its rows.
+
+    Args:
+        schema (dict): catalog schema
+        compiled (dict): schema of the column transforms, see
+            Rakuten.infer_schema; None while the report columns are unknown
+    """
+    if compiled is None:
+        return False
+
+    produced = compiled.get('properties', {})
+
+    for name, field in schema.get('properties', {}).items():
+        expected = produced.get(name)
+        if expected is None:
+            continue
+        if field.get('type') != expected.get('type'):
+            return False
+        if field.get('format') != expected.get('format'):
+            return False
+
+    return True
+
+
+def prepare_schema(instance):
+    """
+    Get the schema dict, metadata map, fast path flag and selected fields of a
+    stream, once per stream and again whenever its schema or report columns
+    change.
+    """
+    stream = instance.stream
+
+    schema = stream.schema.to_dict()
+    mdata = metadata.to_map(stream.metadata)
+
+    fast_transform = False
+    compiled = None
+
+    if instance.fast_transform:
+        compiled = instance.get_compiled_schema()
+        fast_transform = is_compiled_schema(schema, compiled)
+
+    if compiled is not None and not fast_transform:
+        logger.warning(
+            "%s: catalog schema differs from the compiled column types, "
+            "validating records with Transformer",
+            stream.tap_stream_id
+        )
+
+    return schema, mdata, fast_transform, get_selected_fields(schema, mdata)
+
 
 def sync_stream(state, instance):
     stream = instance.stream
 
-    with metrics.record_counter(stream.tap_stream_id) as counter:
-        for (stream, record) in instance.sync(state):
+    current_schema = stream.schema
+    current_columns = instance.columns
+    schema, mdata, fast_transform, selected_fields = prepare_schema(instance)
+
+    stage_metrics = instrumentation.get_instrumentation()
+    stats = stage_metrics.new_stats()
+    perf_counter = time.perf_counter
+
+    heartbeat = output.StateHeartbeat(
+        state,
+        records=instance.state_interval_records,
+        seconds=instance.state_interval_seconds
+    )
+
+    items = instance.sync(state)
+    if instance.pipeline is not None:
+        items = instance.pipeline.run(items)
+
+    with metrics.record_counter(stream.tap_stream_id) as counter, \
+            Transformer() as transformer:
+        for (stream, record) in items:
+            if isinstance(record, SerializedRecords):
+                # already transformed and serialized by a worker process, see
+                # Stream.get_serialize_options
+                counter.increment(len(record))
+                output.write_serialized(stream.tap_stream_id, record)
+                if instance.replication_method == "INCREMENTAL":
+                    heartbeat.tick(len(record))
+                continue
+
             counter.increment()
 
+            if stream.schema is not current_schema \
+                    or instance.columns is not current_columns:
+                # the stream emitted a new SCHEMA after a header change, or
+                # the report columns the fast path depends on are now known
+                current_schema = stream.schema
+                current_columns = instance.columns
+                schema, mdata, fast_transform, selected_fields = \
+                    prepare_schema(instance)
+
             try:
-                with Transformer() as transformer:
-                    record = transformer.transform(
-                        record,
-                        stream.schema.to_dict(),
-                        metadata.to_map(stream.metadata)
-                    )
-                singer.write_record(stream.tap_stream_id, record)
+                if stats is not None:
+                    started = perf_counter()
+                if fast_transform:
+                    # only apply the catalog field selection
+                    record = {
+                        k: v for k, v in record.items() if k in selected_fields
+                    }
+                else:
+                    record = transformer.transform(record, schema, mdata)
+                if stats is not None:
+                    validated = perf_counter()
+                    stats.add_time('validate', validated - started)
+                output.write_record(stream.tap_stream_id, record)
+                if stats is not None:
+                    stats.add_time('output', perf_counter() - validated)
+                # the bookmark only moves at window boundaries, where the
+                # stream emits STATE itself
                 if instance.replication_method == "INCREMENTAL":
-                    singer.write_state(state)
+                    heartbeat.tick()
 
             except Exception as e:
                 logger.error('Handled exception: {error}'.format(error=str(e)))
+                # the transformer is shared by the whole stream, so don't let
+                # the errors of this record leak into the next failure
+                transformer.errors = []
                 continue
 
+        stage_metrics.record_stream(stream.tap_stream_id, stats)
+
         return counter.value
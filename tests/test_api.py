@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+import queue
+import threading
+import unittest
+from singer import metadata
+from singer.catalog import Catalog
+from tap_rakuten import api
+from tap_rakuten.api import EventWriter, Cancelled, select_all
+
+
+class Test_EventWriter(unittest.TestCase):
+
+    def get_events(self, events):
+        items = []
+        while not events.empty():
+            items.append(events.get())
+        return items
+
+    def test_batches_records_until_state(self):
+
+        events = queue.Queue()
+        writer = EventWriter(events, threading.Event(), batch_size=2)
+
+        for n in range(3):
+            writer.write_record('report', {'n': n})
+        writer.write_state({'bookmarks': {}})
+
+        self.assertEqual(self.get_events(events), [
+            {'type': 'RECORDS', 'stream': 'report',
+             'records': [{'n': 0}, {'n': 1}]},
+            {'type': 'RECORDS', 'stream': 'report', 'records': [{'n': 2}]},
+            {'type': 'STATE', 'value': {'bookmarks': {}}}
+        ])
+
+    def test_omit_nulls(self):
+
+        events = queue.Queue()
+        writer = EventWriter(events, threading.Event(), omit_nulls=True)
+
+        writer.write_record('report', {'n': 0, 'sales': None})
+
+        self.assertEqual(self.get_events(events), [
+            {'type': 'RECORD', 'stream': 'report', 'record': {'n': 0}}
+        ])
+
+    def test_cancelled(self):
+
+        cancelled = threading.Event()
+        writer = EventWriter(queue.Queue(1), cancelled)
+
+        writer.write_record('report', {'n': 0})
+        cancelled.set()
+
+        with self.assertRaises(Cancelled):
+            writer.write_record('report', {'n': 1})
+
+    def test_select_all(self):
+
+        catalog = select_all(Catalog.from_dict({'streams': [{
+            'stream': 'report',
+            'tap_stream_id': 'report',
+            'schema': {'type': 'object', 'properties': {}},
+            'metadata': []
+        }]}))
+
+        mdata = metadata.to_map(catalog.streams[0].metadata)
+        self.assertTrue(metadata.get(mdata, (), 'selected'))
+
+
+class Test_Sync(unittest.TestCase):
+
+    def test_one_sync_per_process(self):
+
+        config = {
+            'token': 'TOKEN',
+            'region': 'en',
+            'start_date': '2019-01-01T00:00:00Z',
+            'date_type': 'transaction',
+            'report_slug': 'report'
+        }
+        catalog = {'streams': []}
+
+        with api._active:
+            with self.assertRaises(RuntimeError):
+                next(api.sync(config, catalog=catalog))
+
+        self.assertEqual(list(api.sync(config, catalog=catalog)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
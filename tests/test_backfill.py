@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from singer.catalog import Catalog
+import tap_rakuten
+from tap_rakuten.backfill import WorkQueue
+from tap_rakuten.utilities import to_utc
+
+
+class Test_WorkQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.queue = WorkQueue(os.path.join(self.tmp.name, 'backfill.db'))
+        self.queue.plan(
+            'report',
+            to_utc(datetime(2020, 1, 1)),
+            to_utc(datetime(2020, 1, 10)),
+            shard_days=4
+        )
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_shard(self, worker, fail=()):
+        shard = self.queue.claim(worker)
+        for day in self.queue.get_days(shard):
+            if day in fail:
+                self.queue.mark_day(shard, day, worker, error='failed')
+            else:
+                self.queue.mark_day(shard, day, worker, rows=10)
+        self.queue.finish(shard)
+        return shard
+
+    def test_workers_claim_distinct_shards(self):
+
+        shards = [self.queue.claim(worker) for worker in ('a', 'b', 'c', 'd')]
+
+        self.assertEqual(
+            [(s.start_day, s.end_day) for s in shards[:3]],
+            [('2020-01-01', '2020-01-04'), ('2020-01-05', '2020-01-08'),
+             ('2020-01-09', '2020-01-10')]
+        )
+        self.assertIsNone(shards[3])
+
+    def test_expired_lease_is_reclaimed(self):
+
+        self.queue.lease_seconds = -1
+
+        first = self.queue.claim('a')
+        second = self.queue.claim('b')
+
+        self.assertEqual(first.start_day, second.start_day)
+
+    def test_bookmarks_merge_contiguous_days(self):
+
+        self.run_shard('a')
+        self.assertEqual(self.queue.get_bookmarks(), {'report': '2020-01-04'})
+
+        # a gap in the second shard holds back the third
+        self.run_shard('a', fail=('2020-01-06',))
+        self.run_shard('b')
+        self.assertEqual(self.queue.get_bookmarks(), {'report': '2020-01-05'})
+        self.assertEqual(
+            self.queue.summary()['report']['failed'],
+            {'days': 1, 'rows': 0}
+        )
+
+    def test_replan_retries_failed_days(self):
+
+        self.run_shard('a', fail=('2020-01-02',))
+        self.run_shard('a')
+        self.run_shard('a')
+        self.assertIsNone(self.queue.claim('a'))
+
+        self.queue.plan(
+            'report',
+            to_utc(datetime(2020, 1, 1)),
+            to_utc(datetime(2020, 1, 10)),
+            shard_days=4
+        )
+        shard = self.queue.claim('a')
+
+        self.assertEqual(self.queue.get_days(shard), ['2020-01-02'])
+
+    def test_exhausted_days(self):
+
+        self.queue.max_attempts = 1
+        self.run_shard('a', fail=('2020-01-02',))
+
+        self.assertEqual(self.queue.get_exhausted_days(),
+                         [('report', '2020-01-02')])
+
+
+class BrokenClient():
+    transform_pool = None
+
+    def report(self, report_slug, start_date, **kwargs):
+        if start_date.day == 2:
+            raise ValueError('broken day')
+        return iter([{'day': start_date.day}])
+
+
+class Test_Backfill(unittest.TestCase):
+
+    def test_exhausted_days_fail_every_run(self):
+
+        catalog = Catalog.from_dict({'streams': [{
+            'stream': 'report',
+            'tap_stream_id': 'report',
+            'schema': {
+                'type': 'object',
+                'properties': {'day': {'type': ['integer', 'null']}}
+            },
+            'metadata': [{'breadcrumb': [], 'metadata': {'selected': True}}]
+        }]})
+
+        with tempfile.TemporaryDirectory() as tmp:
+            config = {
+                'report_slug': 'report',
+                'start_date': '2020-01-01T00:00:00Z',
+                'backfill': {
+                    'queue_path': os.path.join(tmp, 'backfill.db'),
+                    'end_date': '2020-01-03T00:00:00Z',
+                    'max_attempts': 1
+                }
+            }
+            state = {}
+
+            for run in range(2):
+                with self.assertRaisesRegex(Exception, 'need a manual reset'):
+                    tap_rakuten.backfill(BrokenClient(), catalog, state, config)
+
+        self.assertEqual(
+            state['bookmarks']['report']['last_sync'],
+            '2020-01-01T00:00:00.000000Z'
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
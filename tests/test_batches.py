@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+import unittest
+from tap_rakuten.client import Rakuten
+from unittest import mock
+from tap_rakuten import batches
+from tap_rakuten.batches import compile_batch_builder, DictionaryColumn
+from tap_rakuten.batches import ListColumn, to_numeric_column
+
+test_columns = [
+    "# of Clicks",
+    "Sales",
+    "Publisher Name",
+    "Transaction Date",
+    "Transaction Time",
+    "Signature Match Date"
+]
+
+test_rows = [
+    ["5", "35.5", "Test Publisher", "2/22/19", "10:00:05", "12/12/18"],
+    ["", "null", "Test Publisher", "2/22/19", "10:00:06", ""],
+    ["7", "1", "", "2/23/19", "00:00:00"]
+]
+
+
+class Test_Batches(unittest.TestCase):
+
+    def get_builder(self):
+
+        rak = Rakuten("TOKEN", "slug")
+
+        column_map = rak.get_column_map(rak.get_field_data(test_columns))
+
+        return rak, compile_batch_builder(column_map, test_columns)
+
+    def test_matches_row_transform(self):
+
+        rak, builder = self.get_builder()
+
+        transformer = rak.compile_transformer(test_columns)
+
+        batch = builder(test_rows)
+
+        self.assertEqual(len(batch), 3)
+        self.assertEqual(
+            batch.to_pylist(),
+            [transformer(row) for row in test_rows]
+        )
+
+    def test_dictionary_encoding(self):
+
+        _, builder = self.get_builder()
+
+        column = builder(test_rows).columns['publisher_name']
+
+        self.assertIsInstance(column, DictionaryColumn)
+        self.assertEqual(column.dictionary, ['Test Publisher'])
+        self.assertEqual(list(column.codes), [0, 0, -1])
+
+    def test_integers_beyond_64_bits(self):
+
+        values = ['1', '99999999999999999999', '']
+        expected = [1, 99999999999999999999, None]
+
+        column = to_numeric_column(values, 'integer')
+        self.assertIsInstance(column, ListColumn)
+        self.assertEqual(column.to_pylist(), expected)
+
+        with mock.patch.object(batches, 'np', None):
+            column = to_numeric_column(values, 'integer')
+        self.assertEqual(column.to_pylist(), expected)
+
+        # unparseable values take the value by value conversion
+        self.assertEqual(
+            to_numeric_column(['x', '99999999999999999999'], 'integer')
+            .to_pylist(),
+            [None, 99999999999999999999]
+        )
+
+    def test_empty_batch(self):
+
+        _, builder = self.get_builder()
+
+        self.assertEqual(builder([]).to_pylist(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
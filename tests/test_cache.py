@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from tap_rakuten.cache import SchemaCache, ResponseCache
+from tap_rakuten.cache import FingerprintIndex, fingerprint
+from tap_rakuten.client import Rakuten
+from tap_rakuten.streams import Stream
+
+
+class Test_SchemaCache(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_get_put(self):
+
+        cache = SchemaCache(self.path)
+
+        self.assertIsNone(cache.get('en', 'report-slug'))
+
+        cache.put('en', 'report-slug', ['Sales', 'Publisher ID'])
+
+        self.assertEqual(
+            cache.get('en', 'report-slug'),
+            ['Sales', 'Publisher ID']
+        )
+        self.assertIsNone(cache.get('fr', 'report-slug'))
+
+    def test_expired(self):
+
+        cache = SchemaCache(self.path, ttl=-1)
+
+        cache.put('en', 'report-slug', ['Sales'])
+
+        self.assertIsNone(cache.get('en', 'report-slug'))
+
+
+class Test_ResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.key = {
+            'region': 'en',
+            'report_slug': 'report-slug',
+            'date_type': 'transaction',
+            'start_date': '2019-01-01',
+            'end_date': '2019-01-03'
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_put_is_content_addressed(self):
+
+        cache = ResponseCache(self.path)
+
+        entry = cache.put(self.key, [b'Sales\n', b'1.5\n'], etag='"abc"')
+
+        self.assertEqual(cache.get(self.key)['sha256'], entry['sha256'])
+        self.assertEqual(cache.get(self.key)['etag'], '"abc"')
+
+        other = dict(self.key, start_date='2019-01-04', end_date='2019-01-04')
+        self.assertEqual(
+            cache.put(other, [b'Sales\n1.5\n'])['sha256'],
+            entry['sha256']
+        )
+
+        with open(cache.get_object_path(entry['sha256']), 'rb') as f:
+            self.assertEqual(f.read(), b'Sales\n1.5\n')
+
+    def test_find_covering(self):
+
+        cache = ResponseCache(self.path)
+
+        for start, end in [('2019-01-01', '2019-01-01'),
+                           ('2019-01-02', '2019-01-03'),
+                           ('2019-01-05', '2019-01-05')]:
+            cache.put(dict(self.key, start_date=start, end_date=end), [b''])
+
+        entries = cache.find_covering(self.key)
+
+        self.assertEqual(
+            [(e['start_date'], e['end_date']) for e in entries],
+            [('2019-01-01', '2019-01-01'), ('2019-01-02', '2019-01-03')]
+        )
+        self.assertIsNone(
+            cache.find_covering(dict(self.key, end_date='2019-01-05'))
+        )
+
+    def test_find_window(self):
+
+        cache = ResponseCache(self.path)
+
+        for start, end in [('2019-01-01', '2019-01-01'),
+                           ('2019-01-01', '2019-01-02'),
+                           ('2019-01-02', '2019-01-03'),
+                           ('2019-01-03', '2019-01-04')]:
+            cache.put(dict(self.key, start_date=start, end_date=end), [b''])
+
+        self.assertEqual(cache.find_window(self.key),
+                         ('2019-01-01', '2019-01-02'))
+        self.assertEqual(cache.find_window(self.key, reverse=True),
+                         ('2019-01-02', '2019-01-03'))
+        self.assertIsNone(
+            cache.find_window(dict(self.key, start_date='2019-01-04'))
+        )
+
+    def test_replay_with_other_window_size(self):
+
+        cache = ResponseCache(self.path)
+
+        for start, end, sales in [('2019-01-12', '2019-01-12', b'1'),
+                                  ('2019-01-13', '2019-01-14', b'2'),
+                                  ('2019-01-15', '2019-01-16', b'3')]:
+            cache.put(dict(self.key, start_date=start, end_date=end),
+                      [b'Sales\r\n' + sales + b'\r\n'])
+
+        client = Rakuten('TOKEN', response_cache=cache, replay=True)
+        stream = Stream(client, {
+            'report_slug': 'report-slug',
+            'start_date': '2019-01-12T00:00:00Z',
+            'end_date': '2019-01-16T00:00:00Z',
+            'window_days': 4,
+            'replay': True
+        })
+        state = {}
+
+        records = [record for _, record in stream.sync(state)]
+
+        self.assertEqual([r['sales'] for r in records], [1.0, 2.0, 3.0])
+        self.assertEqual(
+            state['bookmarks']['report_slug']['last_sync'],
+            '2019-01-16T00:00:00.000000Z'
+        )
+
+
+class Test_FingerprintIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_fingerprint(self):
+
+        self.assertEqual(
+            fingerprint({'sales': 1.5, 'publisher_id': 1}),
+            fingerprint({'sales': 1.5, 'publisher_id': 1})
+        )
+        self.assertNotEqual(
+            fingerprint({'sales': 1.5, 'publisher_id': 1}),
+            fingerprint({'sales': 2.5, 'publisher_id': 1})
+        )
+        self.assertEqual(len(fingerprint('{"sales":1.5}')), 8)
+
+    def test_save_load_prune(self):
+
+        index = FingerprintIndex(self.path, 'report')
+        day = datetime(2019, 1, 2)
+        fingerprints = {fingerprint({'row': n}) for n in range(5)}
+
+        self.assertEqual(index.load(day), set())
+
+        index.save(day, fingerprints)
+        index.save(datetime(2019, 1, 1), fingerprints)
+        self.assertEqual(index.load(day), fingerprints)
+
+        index.prune(day)
+        self.assertEqual(index.load(datetime(2019, 1, 1)), set())
+        self.assertEqual(index.load(day), fingerprints)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import gzip
+import json
+import tempfile
+import unittest
+from datetime import datetime
+from urllib.parse import urlparse, unquote
+from tap_rakuten.export import FileExporter
+from tap_rakuten.output import MessageWriter
+
+
+class Test_FileExporter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.stream = io.BytesIO()
+        self.exporter = FileExporter(
+            MessageWriter(stream=self.stream),
+            self.tmp.name
+        )
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def get_messages(self):
+        self.exporter.flush()
+        return [json.loads(l) for l in self.stream.getvalue().splitlines()]
+
+    def test_exports_day_partition(self):
+
+        day = datetime(2020, 1, 1)
+        schema = {'properties': {'sales': {'type': ['number', 'null']}}}
+
+        self.exporter.write_schema('report', schema, [])
+        self.exporter.write_record('report', {'sales': 1.5})
+        self.exporter.write_record('report', {'sales': None})
+        self.exporter.complete_window('report', day, day)
+        self.exporter.write_state({'bookmarks': {}})
+
+        schema_message, batch, state = self.get_messages()
+
+        self.assertEqual(schema_message['type'], 'SCHEMA')
+        self.assertEqual(batch['type'], 'BATCH')
+        self.assertEqual(batch['encoding'],
+                         {'format': 'jsonl', 'compression': 'gzip'})
+        self.assertEqual(state['type'], 'STATE')
+
+        path = unquote(urlparse(batch['manifest'][0]).path)
+        self.assertEqual(
+            os.path.basename(os.path.dirname(path)),
+            'date=2020-01-01'
+        )
+
+        with gzip.open(path, 'rb') as f:
+            records = [json.loads(l) for l in f]
+
+        self.assertEqual(records, [{'sales': 1.5}, {'sales': None}])
+
+    def test_empty_window(self):
+
+        day = datetime(2020, 1, 1)
+
+        self.exporter.complete_window('report', day, day)
+
+        self.assertEqual(self.get_messages(), [])
+
+    def test_discard_incomplete(self):
+
+        self.exporter.write_record('report', {'sales': 1.5})
+        self.exporter.discard()
+
+        self.assertEqual(os.listdir(os.path.join(self.tmp.name, 'report')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest import mock
+from datetime import datetime
+from tap_rakuten import instrumentation
+from tap_rakuten.instrumentation import Instrumentation
+
+
+class Test_Instrumentation(unittest.TestCase):
+
+    def test_disabled(self):
+
+        metrics = Instrumentation()
+
+        self.assertIsNone(metrics.new_stats())
+
+    def test_summary_merges_windows(self):
+
+        metrics = Instrumentation(enabled=True)
+
+        for rows in (10, 20):
+            stats = metrics.new_stats()
+            with stats.timer('transform'):
+                pass
+            stats.add_time('download', 1.5)
+            stats.add_count('rows', rows)
+            metrics.record_window(
+                'report', datetime(2019, 1, 1), datetime(2019, 1, 1), stats
+            )
+
+        summary = metrics.summary()['streams']['report']
+
+        self.assertEqual(summary['counts'], {'rows': 30})
+        self.assertEqual(summary['seconds']['download'], 3.0)
+        self.assertIn('transform', summary['seconds'])
+
+    @unittest.skipIf(instrumentation.resource is None, 'no resource module')
+    def test_peak_memory_units(self):
+
+        usage = mock.Mock(ru_maxrss=2048)
+
+        with mock.patch.object(instrumentation.resource, 'getrusage',
+                               return_value=usage):
+            with mock.patch.object(instrumentation.sys, 'platform', 'linux'):
+                self.assertEqual(instrumentation.peak_memory(), 2048 * 1024)
+            with mock.patch.object(instrumentation.sys, 'platform', 'darwin'):
+                self.assertEqual(instrumentation.peak_memory(), 2048)
+
+
+if __name__ == '__main__':
+    unittest.main()
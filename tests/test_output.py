@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+import io
+import json
+import unittest
+from unittest import mock
+from tap_rakuten import output
+from tap_rakuten.output import MessageWriter, StateHeartbeat, dumps
+
+
+class Test_MessageWriter(unittest.TestCase):
+
+    def test_buffers_until_state(self):
+
+        stream = io.BytesIO()
+        writer = MessageWriter(stream=stream)
+
+        writer.write_record('report', {'sales': 1.5})
+        self.assertEqual(stream.getvalue(), b'')
+
+        writer.write_state({'bookmarks': {}})
+        messages = [json.loads(l) for l in stream.getvalue().splitlines()]
+
+        self.assertEqual(messages, [
+            {'type': 'RECORD', 'stream': 'report', 'record': {'sales': 1.5}},
+            {'type': 'STATE', 'value': {'bookmarks': {}}}
+        ])
+
+    def test_flushes_at_buffer_size(self):
+
+        stream = io.BytesIO()
+        writer = MessageWriter(buffer_size=10, stream=stream)
+
+        writer.write_record('report', {'sales': 1.5})
+
+        self.assertTrue(stream.getvalue().endswith(b'\n'))
+
+    def test_omit_nulls(self):
+
+        stream = io.BytesIO()
+        writer = MessageWriter(omit_nulls=True, stream=stream)
+
+        writer.write_record('report', {'sales': None, 'publisher_id': 1})
+        writer.flush()
+
+        self.assertEqual(
+            json.loads(stream.getvalue())['record'],
+            {'publisher_id': 1}
+        )
+
+    def test_large_integers(self):
+
+        stream = io.BytesIO()
+        writer = MessageWriter(stream=stream)
+
+        writer.write_record('report', {'order_id': 2 ** 70, 'sales': 1.5})
+        writer.flush()
+
+        self.assertEqual(
+            json.loads(stream.getvalue())['record'],
+            {'order_id': 2 ** 70, 'sales': 1.5}
+        )
+        self.assertEqual(json.loads(dumps({'id': -2 ** 64}))['id'], -2 ** 64)
+
+    def test_background_keeps_order(self):
+
+        stream = io.BytesIO()
+        writer = MessageWriter(buffer_size=10, stream=stream, background=True)
+
+        for n in range(100):
+            writer.write_record('report', {'n': n})
+        writer.write_state({'bookmarks': {}})
+        writer.flush()
+
+        messages = [json.loads(l) for l in stream.getvalue().splitlines()]
+
+        self.assertEqual(
+            [m['record']['n'] for m in messages[:-1]],
+            list(range(100))
+        )
+        self.assertEqual(messages[-1]['type'], 'STATE')
+
+
+class Test_State(unittest.TestCase):
+
+    def setUp(self):
+        self.stream = io.BytesIO()
+        self.previous = output.get_writer()
+        output.set_writer(MessageWriter(stream=self.stream))
+
+    def tearDown(self):
+        output.set_writer(self.previous)
+
+    def get_states(self):
+        output.flush()
+        return [
+            message['value']
+            for message in map(json.loads, self.stream.getvalue().splitlines())
+            if message['type'] == 'STATE'
+        ]
+
+    def test_write_bookmark_only_on_change(self):
+
+        state = {}
+
+        output.write_bookmark(state, 'report', 'last_sync', '2019-01-01')
+        output.write_bookmark(state, 'report', 'last_sync', '2019-01-01')
+        output.write_bookmarks(state, 'report', {'last_sync': '2019-01-01'})
+        output.write_bookmark(state, 'report', 'last_sync', '2019-01-02')
+
+        self.assertEqual(self.get_states(), [
+            {'bookmarks': {'report': {'last_sync': '2019-01-01'}}},
+            {'bookmarks': {'report': {'last_sync': '2019-01-02'}}}
+        ])
+
+    def test_heartbeat_records(self):
+
+        state = {'bookmarks': {}}
+        heartbeat = StateHeartbeat(state, records=3)
+
+        for _ in range(7):
+            heartbeat.tick()
+        heartbeat.tick(5)
+
+        self.assertEqual(len(self.get_states()), 3)
+
+    def test_heartbeat_seconds(self):
+
+        state = {'bookmarks': {}}
+        clock = [1000.0]
+
+        with mock.patch('tap_rakuten.output.time.time', lambda: clock[0]):
+            heartbeat = StateHeartbeat(state, seconds=10)
+            heartbeat.tick()
+            clock[0] += 11
+            heartbeat.tick()
+            heartbeat.tick()
+
+        self.assertEqual(len(self.get_states()), 1)
+
+    def test_heartbeat_disabled(self):
+
+        heartbeat = StateHeartbeat({'bookmarks': {}})
+
+        for _ in range(100):
+            heartbeat.tick()
+
+        self.assertEqual(self.get_states(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+import unittest
+from tap_rakuten.pipeline import Pipeline
+
+
+class Test_Pipeline(unittest.TestCase):
+
+    def test_preserves_order(self):
+
+        pipeline = Pipeline(queue_size=2, batch_size=3)
+
+        self.assertEqual(list(pipeline.run(range(100))), list(range(100)))
+
+    def test_deferred_calls_follow_items(self):
+
+        pipeline = Pipeline(queue_size=2, batch_size=100)
+        consumed = []
+
+        def produce():
+            for n in range(5):
+                yield n
+                pipeline.defer(consumed.append, 'state {}'.format(n))
+
+        for item in pipeline.run(produce()):
+            consumed.append(item)
+
+        self.assertEqual(consumed, [
+            0, 'state 0', 1, 'state 1', 2, 'state 2', 3, 'state 3',
+            4, 'state 4'
+        ])
+
+    def test_defer_outside_producer(self):
+
+        called = []
+
+        Pipeline().defer(called.append, 1)
+
+        self.assertEqual(called, [1])
+
+    def test_raises_producer_error(self):
+
+        def produce():
+            yield 1
+            raise ValueError('failed')
+
+        with self.assertRaises(ValueError):
+            list(Pipeline().run(produce()))
+
+    def test_stops_producer_when_closed(self):
+
+        closed = []
+
+        def produce():
+            try:
+                n = 0
+                while True:
+                    yield n
+                    n += 1
+            finally:
+                closed.append(True)
+
+        items = Pipeline(queue_size=1, batch_size=1).run(produce())
+        self.assertEqual(next(items), 0)
+        items.close()
+
+        self.assertEqual(closed, [True])
+
+
+if __name__ == '__main__':
+    unittest.main()
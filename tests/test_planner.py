@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+import unittest
+from datetime import datetime
+from tap_rakuten.planner import WindowPlanner, merge_ranges, get_gaps
+
+
+def day(n):
+    return datetime(2019, 1, n)
+
+
+class Test_WindowPlanner(unittest.TestCase):
+
+    def test_next_window_bounded_by_last_date(self):
+
+        planner = WindowPlanner(initial_days=7)
+
+        window = planner.next_window(datetime(2019, 1, 1), datetime(2019, 1, 3))
+
+        self.assertEqual(window, (datetime(2019, 1, 1), datetime(2019, 1, 3)))
+
+    def test_grows_on_small_fast_responses(self):
+
+        planner = WindowPlanner(initial_days=1, max_days=8, target_rows=1000)
+
+        planner.record(1, 10, 0.1)
+        self.assertEqual(planner.size, 2)
+
+        planner.record(2, 20, 0.1)
+        planner.record(4, 40, 0.1)
+        planner.record(8, 80, 0.1)
+        self.assertEqual(planner.size, 8)
+
+    def test_growth_capped_by_projected_rows(self):
+
+        planner = WindowPlanner(initial_days=4, target_rows=1000)
+
+        planner.record(4, 800, 0.1)
+
+        self.assertEqual(planner.size, 5)
+
+    def test_shrinks_on_slow_or_huge_responses(self):
+
+        planner = WindowPlanner(initial_days=8, target_rows=1000)
+
+        planner.record(8, 5000, 0.1)
+        self.assertEqual(planner.size, 4)
+
+        planner.record(4, 10, 120)
+        self.assertEqual(planner.size, 2)
+
+    def test_record_failure(self):
+
+        planner = WindowPlanner(initial_days=2)
+
+        self.assertTrue(planner.record_failure(2))
+        self.assertEqual(planner.size, 1)
+        self.assertFalse(planner.record_failure(1))
+
+    def test_previous_window_bounded_by_first_date(self):
+
+        planner = WindowPlanner(initial_days=7)
+
+        window = planner.previous_window(day(10), day(6))
+
+        self.assertEqual(window, (day(6), day(10)))
+
+    def test_merge_ranges(self):
+
+        self.assertEqual(
+            merge_ranges([(day(5), day(6)), (day(1), day(2)), (day(3), day(3))]),
+            [[day(1), day(3)], [day(5), day(6)]]
+        )
+
+    def test_get_gaps(self):
+
+        ranges = [[day(3), day(4)], [day(7), day(8)]]
+
+        self.assertEqual(
+            get_gaps(ranges, day(1), day(10)),
+            [(day(1), day(2)), (day(5), day(6)), (day(9), day(10))]
+        )
+        self.assertEqual(get_gaps(ranges, day(3), day(4)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+import io
+import csv
+import json
+import unittest
+from tap_rakuten.client import Rakuten
+from tap_rakuten.processes import TransformPool, split_csv_chunks
+
+header = ['Transaction Date', 'Transaction Time', 'Sales', 'Product Name']
+
+report = (
+    '01/02/20,10:00:00,1.50,"Multi\r\nline"\r\n'
+    '01/02/20,11:00:00,2.00,Plain\r\n'
+    '\r\n'
+    '01/03/20,12:00:00,,"Quoted ""name"""\r\n'
+)
+
+
+def get_lines():
+    return io.StringIO(report, newline='')
+
+
+class Test_TransformPool(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = TransformPool(processes=2, chunk_rows=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.shutdown()
+
+    def test_split_keeps_quoted_newlines(self):
+
+        chunks = list(split_csv_chunks(get_lines(), chunk_rows=1))
+
+        self.assertEqual(chunks[0], '01/02/20,10:00:00,1.50,"Multi\r\nline"\r\n')
+        self.assertEqual(''.join(chunks), report)
+
+    def test_map_matches_report_transform(self):
+
+        transformer = Rakuten('TOKEN').compile_transformer(header)
+        expected = [
+            transformer(row)
+            for row in csv.reader(get_lines()) if row
+        ]
+
+        self.assertEqual(list(self.pool.map(get_lines(), header)), expected)
+
+    def test_map_serializes_records(self):
+
+        chunks = list(self.pool.map(
+            get_lines(),
+            header,
+            exclude={'product_name'},
+            serialize={'stream': 'report', 'omit_nulls': True}
+        ))
+
+        self.assertEqual(sum(len(c) for c in chunks), 3)
+        messages = [
+            json.loads(line)
+            for chunk in chunks for line in chunk.data.splitlines()
+        ]
+        self.assertEqual(messages[0]['stream'], 'report')
+        self.assertNotIn('product_name', messages[0]['record'])
+        self.assertNotIn('sales', messages[2]['record'])
+
+
+if __name__ == '__main__':
+    unittest.main()
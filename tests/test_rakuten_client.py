@@ -1,8 +1,15 @@
 #!/usr/bin/env python3
 
+import os
+import tempfile
 import unittest
+from contextlib import contextmanager
 from pprint import pprint
-from tap_rakuten.client import Rakuten
+from datetime import datetime
+import csv
+from tap_rakuten.client import Rakuten, combine_date_time, to_datetime
+from tap_rakuten.client import response_text, SpoolLimitExceeded
+from tap_rakuten.client import parse_date, parse_time, utc_datetime_string
 
 test_columns = [
     "# of Clicks",
@@ -135,6 +142,171 @@ class Test_RakutenClient(unittest.TestCase):
             test_transformed_row
         )
 
+    def test_compile_transformer(self):
+
+        rak = Rakuten("TOKEN", "slug")
+
+        transformer = rak.compile_transformer(test_columns)
+
+        row = transformer([test_row[name] for name in test_columns])
+
+        self.assertDictEqual(
+            row,
+            test_transformed_row
+        )
+
+    def test_compile_transformer_short_row(self):
+
+        rak = Rakuten("TOKEN", "slug")
+
+        transformer = rak.compile_transformer(test_columns)
+
+        row = transformer(["5", "35.5", "1000001", "", "2/22/19", "10:00:05"])
+
+        self.assertEqual(row['num_of_clicks'], 5)
+        self.assertIsNone(row['publisher_name'])
+        self.assertIsNone(row['transaction_created_on_time'])
+        self.assertIsNone(row['signature_match_date'])
+
+    def test_compile_transformer_exclude(self):
+
+        rak = Rakuten("TOKEN", "slug")
+
+        transformer = rak.compile_transformer(
+            test_columns,
+            exclude={'sales', 'transaction_datetime'}
+        )
+
+        row = transformer([test_row[name] for name in test_columns])
+
+        expected = dict(test_transformed_row)
+        del expected['sales']
+        del expected['transaction_datetime']
+
+        self.assertDictEqual(row, expected)
+
+    def test_combine_date_time(self):
+
+        for date, time in [("2/22/19", "10:00:05"), ("12/31/99", "23:59:59"),
+                           ("1/1/00", "0:0:0"), ("02/03/68", "01:02:03")]:
+            self.assertEqual(
+                combine_date_time(date, time),
+                utc_datetime_string(
+                    datetime.combine(parse_date(date), parse_time(time))
+                )
+            )
+
+        with self.assertRaises(ValueError):
+            combine_date_time("", "10:00:05")
+
+    def test_to_datetime(self):
+
+        self.assertEqual(
+            to_datetime("12/12/18"),
+            utc_datetime_string(parse_date("12/12/18"))
+        )
+        self.assertIsNone(to_datetime(""))
+        self.assertIsNone(to_datetime("null"))
+
+    def test_response_text(self):
+
+        class FakeResponse():
+            def iter_content(self, chunk_size):
+                data = '\ufeffSales,Publisher Name\r\n1.5,"Test\nPublisher"\r\n'
+                data = data.encode('utf-8')
+                # split inside the byte order mark and the quoted value
+                return iter([data[:2], data[2:30], data[30:]])
+
+        rows = list(csv.reader(response_text(FakeResponse(), chunk_size=4)))
+
+        self.assertEqual(rows, [
+            ['Sales', 'Publisher Name'],
+            ['1.5', 'Test\nPublisher']
+        ])
+
+    def test_spooled_report(self):
+
+        data = '\ufeffSales,Publisher Name\r\n1.5,"Test\nPublisher"\r\n'
+        released = []
+
+        class FakeResponse():
+            def iter_content(self, chunk_size):
+                encoded = data.encode('utf-8')
+                return iter([encoded[:7], encoded[7:]])
+
+        @contextmanager
+        def get(report_slug, **kwargs):
+            yield FakeResponse()
+            released.append(report_slug)
+
+        with tempfile.TemporaryDirectory() as spool_dir:
+            client = Rakuten('TOKEN', spool_dir=spool_dir)
+            client.get = get
+
+            with client.open_report('report', start_date=datetime.now()) as lines:
+                # the response is released before the first line is parsed
+                self.assertEqual(released, ['report'])
+                rows = list(csv.reader(lines))
+
+            self.assertEqual(os.listdir(spool_dir), [])
+
+            client.spool_max_bytes = 10
+            with self.assertRaises(SpoolLimitExceeded):
+                with client.open_report('report', start_date=datetime.now()):
+                    pass
+
+            self.assertEqual(os.listdir(spool_dir), [])
+
+        self.assertEqual(rows, [
+            ['Sales', 'Publisher Name'],
+            ['1.5', 'Test\nPublisher']
+        ])
+
+    def test_unchanged_report_is_skipped(self):
+
+        data = b'Sales,Publisher Name\r\n1.5,Test\r\n'
+        requests = []
+
+        class FakeResponse():
+            status_code = 200
+            headers = {}
+
+            def iter_content(self, chunk_size):
+                return iter([data])
+
+        class NotModified(FakeResponse):
+            status_code = 304
+
+        @contextmanager
+        def get(report_slug, headers=None, **kwargs):
+            requests.append(headers)
+            yield NotModified() if 'If-None-Match' in headers \
+                else FakeResponse()
+
+        client = Rakuten('TOKEN')
+        client.get = get
+        validators = {}
+
+        def fetch():
+            return list(client.report(
+                'report', start_date=datetime.now(), validators=validators
+            ))
+
+        self.assertEqual(len(fetch()), 1)
+        self.assertTrue(validators['changed'])
+
+        # same content, compared by hash
+        self.assertEqual(fetch(), [])
+        self.assertFalse(validators['changed'])
+
+        # conditional request
+        FakeResponse.headers = {'ETag': '"v2"'}
+        data = b'Sales,Publisher Name\r\n2.5,Test\r\n'
+        self.assertEqual(len(fetch()), 1)
+        self.assertEqual(validators['etag'], '"v2"')
+        self.assertEqual(fetch(), [])
+        self.assertEqual(requests[-1], {'If-None-Match': '"v2"'})
+
     # def test_get_schema(self):
     #     pass
 
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+import time
+import unittest
+import requests
+from unittest import mock
+from tap_rakuten import get_request_timeout
+from tap_rakuten.client import Rakuten, RateLimitException, parse_retry_after
+from tap_rakuten.ratelimit import RateLimiter
+
+
+class FakeResponse():
+
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def close(self):
+        pass
+
+
+class Test_RateLimiter(unittest.TestCase):
+
+    def test_rate(self):
+
+        limiter = RateLimiter(rate=50, burst=1)
+
+        started = time.monotonic()
+        for _ in range(6):
+            limiter.acquire()
+
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+    def test_pause(self):
+
+        limiter = RateLimiter()
+
+        limiter.pause(0.05)
+
+        started = time.monotonic()
+        limiter.acquire()
+
+        self.assertGreaterEqual(time.monotonic() - started, 0.04)
+
+    def test_calls_queued_during_pause_resume_at_rate(self):
+
+        with mock.patch('tap_rakuten.ratelimit.time') as clock:
+            clock.monotonic.return_value = 100.0
+
+            limiter = RateLimiter(rate=1, burst=1)
+            limiter.pause(2)
+
+            # four callers queue up before the pause is over
+            for _ in range(4):
+                limiter.acquire()
+
+        self.assertEqual(
+            [c.args[0] for c in clock.sleep.call_args_list],
+            [2.0, 3.0, 4.0, 5.0]
+        )
+
+    def test_parse_retry_after(self):
+
+        self.assertEqual(parse_retry_after("5"), 5)
+        self.assertEqual(
+            parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0
+        )
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+
+
+class Test_Retry(unittest.TestCase):
+
+    def test_retries_throttled_requests(self):
+
+        rak = Rakuten("TOKEN", backoff=0)
+
+        responses = [
+            FakeResponse(429, {'Retry-After': '0'}),
+            FakeResponse(500),
+            FakeResponse(200)
+        ]
+
+        with mock.patch.object(rak._session, 'get', side_effect=responses):
+            resp = rak.get('report-slug', start_date='2019-01-01')
+
+        self.assertEqual(resp.status_code, 200)
+
+    def test_gives_up_after_max_retries(self):
+
+        rak = Rakuten("TOKEN", max_retries=1, backoff=0)
+
+        responses = [FakeResponse(429), FakeResponse(429)]
+
+        with mock.patch.object(rak._session, 'get', side_effect=responses):
+            with self.assertRaises(RateLimitException):
+                rak.get('report-slug', start_date='2019-01-01')
+
+    def test_retries_timeouts(self):
+
+        rak = Rakuten("TOKEN", backoff=0, timeout=(1, 2))
+
+        responses = [requests.exceptions.ReadTimeout(), FakeResponse(200)]
+
+        with mock.patch.object(rak._session, 'get',
+                               side_effect=responses) as get:
+            resp = rak.get('report-slug', start_date='2019-01-01')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(get.call_args.kwargs['timeout'], (1, 2))
+
+    def test_get_request_timeout(self):
+
+        self.assertEqual(get_request_timeout({}), (10.0, 300.0))
+        self.assertEqual(get_request_timeout({'request_timeout': 30}), 30.0)
+        self.assertEqual(
+            get_request_timeout({'request_timeout': [5, 60]}), (5.0, 60.0)
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
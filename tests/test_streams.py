@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+
+import time
+import threading
+import unittest
+import requests
+from unittest import mock
+from datetime import datetime, timedelta
+from singer import utils
+from singer.catalog import Catalog
+from tap_rakuten.client import Rakuten
+from tap_rakuten.streams import Stream
+
+
+class FakeClient():
+    transform_pool = None
+
+    def __init__(self):
+        self.windows = []
+
+    def report(self, report_slug, start_date, end_date, **kwargs):
+        self.windows.append((start_date.day, end_date.day))
+        return iter([{'day': start_date.day}])
+
+
+class FailingClient(FakeClient):
+    """
+    Fails the first request of each listed day, after `rows_before_failure`
+    of its rows.
+    """
+
+    def __init__(self, failing_days, rows_before_failure):
+        super().__init__()
+        self.failing_days = set(failing_days)
+        self.rows_before_failure = rows_before_failure
+
+    def report(self, report_slug, start_date, end_date, **kwargs):
+        self.windows.append((start_date.day, end_date.day))
+        failing = start_date.day in self.failing_days
+        self.failing_days.discard(start_date.day)
+
+        def rows():
+            for day in range(start_date.day, end_date.day + 1):
+                for n in range(3):
+                    if failing and n == self.rows_before_failure:
+                        raise requests.exceptions.ConnectionError('cut off')
+                    yield {'day': day, 'n': n}
+
+        return rows()
+
+
+class Test_WindowFailures(unittest.TestCase):
+
+    def get_stream(self, client):
+        return Stream(client, {
+            'report_slug': 'report',
+            'start_date': '2019-01-01T00:00:00Z',
+            'end_date': '2019-01-04T00:00:00Z',
+            'window_days': 2,
+            'max_window_days': 2
+        })
+
+    def test_retries_window_failing_before_first_row(self):
+
+        client = FailingClient([1], rows_before_failure=0)
+        state = {}
+
+        records = [r for _, r in self.get_stream(client).sync(state)]
+
+        self.assertEqual(client.windows[:2], [(1, 2), (1, 1)])
+        self.assertEqual(
+            sorted((r['day'], r['n']) for r in records),
+            [(day, n) for day in range(1, 5) for n in range(3)]
+        )
+        self.assertEqual(
+            state['bookmarks']['report']['last_sync'],
+            '2019-01-04T00:00:00.000000Z'
+        )
+
+    def test_failure_partway_does_not_duplicate_rows(self):
+
+        client = FailingClient([3], rows_before_failure=2)
+        state = {}
+        records = []
+
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            for _, record in self.get_stream(client).sync(state):
+                records.append(record)
+
+        keys = [(r['day'], r['n']) for r in records]
+        self.assertEqual(len(keys), len(set(keys)))
+        self.assertEqual(keys[-2:], [(3, 0), (3, 1)])
+        # the failed window is synced again by the next run
+        self.assertEqual(
+            state['bookmarks']['report']['last_sync'],
+            '2019-01-02T00:00:00.000000Z'
+        )
+
+
+class HeaderChangeClient(FakeClient):
+    """
+    The report of day 2 gains a column, and its header is read while day 1
+    is still downloading.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.second_header = threading.Event()
+
+    def get_cached_columns(self, report_slug):
+        return None
+
+    def cache_columns(self, report_slug, columns):
+        pass
+
+    def infer_schema(self, columns):
+        return {
+            'type': 'object',
+            'properties': {c: {'type': ['integer', 'null']} for c in columns}
+        }
+
+    def report(self, report_slug, start_date, end_date, on_header, **kwargs):
+        def rows():
+            if start_date.day == 1:
+                self.second_header.wait(timeout=5)
+                on_header(['day'])
+            else:
+                on_header(['day', 'sales'])
+                self.second_header.set()
+            yield {'day': start_date.day}
+
+        return rows()
+
+
+class DelayedClient(FakeClient):
+    """
+    Delays the windows starting on the days in `delays`, and fails the
+    windows starting on the days in `failures` that many times.
+    """
+
+    def __init__(self, delays=None, failures=None):
+        super().__init__()
+        self.delays = delays or {}
+        self.failures = dict(failures or {})
+        self.lock = threading.Lock()
+
+    def report(self, report_slug, start_date, end_date, **kwargs):
+        with self.lock:
+            self.windows.append((start_date.day, end_date.day))
+            failing = self.failures.get(start_date.day, 0)
+            if failing:
+                self.failures[start_date.day] = failing - 1
+
+        def rows():
+            time.sleep(self.delays.get(start_date.day, 0))
+            if failing:
+                raise requests.exceptions.ConnectionError('failed')
+            for day in range(start_date.day, end_date.day + 1):
+                yield {'day': day}
+
+        return rows()
+
+
+class Test_Concurrent(unittest.TestCase):
+
+    def sync(self, client, window_days=1):
+        stream = Stream(client, {
+            'report_slug': 'report',
+            'start_date': '2019-01-01T00:00:00Z',
+            'end_date': '2019-01-04T00:00:00Z',
+            'window_days': window_days,
+            'max_window_days': window_days,
+            'workers': 3
+        })
+        events = []
+
+        def write_state(state):
+            events.append(
+                ('STATE', state['bookmarks']['report']['last_sync'][:10])
+            )
+
+        with mock.patch('tap_rakuten.output.write_state', write_state):
+            try:
+                for _, record in stream.sync({}):
+                    events.append(('RECORD', record['day']))
+            except requests.exceptions.ConnectionError:
+                events.append(('FAILED', None))
+
+        return events
+
+    def test_out_of_order_windows_are_emitted_in_date_order(self):
+
+        # the first window finishes last, the second fails and is retried
+        # as two single days
+        client = DelayedClient(delays={1: 0.2}, failures={3: 1})
+
+        events = self.sync(client, window_days=2)
+
+        self.assertEqual(
+            sorted(client.windows), [(1, 2), (3, 3), (3, 4), (4, 4)]
+        )
+        self.assertEqual(events, [
+            ('RECORD', 1), ('RECORD', 2), ('STATE', '2019-01-02'),
+            ('RECORD', 3), ('STATE', '2019-01-03'),
+            ('RECORD', 4), ('STATE', '2019-01-04'),
+        ])
+
+    def test_bookmark_stops_before_failed_window(self):
+
+        # day 2 keeps failing while days 3 and 4 finish first
+        client = DelayedClient(delays={2: 0.1}, failures={2: 10})
+
+        events = self.sync(client)
+
+        self.assertEqual(events, [
+            ('RECORD', 1), ('STATE', '2019-01-01'), ('FAILED', None)
+        ])
+        self.assertIn((3, 3), client.windows)
+
+    def test_schema_change_applies_with_its_window(self):
+
+        stream = Stream(HeaderChangeClient(), {
+            'report_slug': 'report',
+            'start_date': '2019-01-01T00:00:00Z',
+            'end_date': '2019-01-02T00:00:00Z',
+            'max_window_days': 1,
+            'workers': 2
+        })
+        stream.stream = Catalog.from_dict({'streams': [{
+            'stream': 'report',
+            'tap_stream_id': 'report',
+            'schema': {
+                'type': 'object',
+                'properties': {'day': {'type': ['integer', 'null']}}
+            },
+            'metadata': []
+        }]}).streams[0]
+
+        seen = [
+            (record['day'], sorted(catalog_entry.schema.properties))
+            for catalog_entry, record in stream.sync({})
+        ]
+
+        self.assertEqual(seen, [(1, ['day']), (2, ['day', 'sales'])])
+
+
+class Test_RecencyFirst(unittest.TestCase):
+
+    def get_stream(self, client):
+        stream = Stream(client, {
+            'report_slug': 'report',
+            'start_date': '2019-01-01T00:00:00Z',
+            'end_date': '2019-01-06T00:00:00Z',
+            'window_days': 2,
+            'max_window_days': 2,
+            'recency_first': True
+        })
+        return stream
+
+    def test_newest_days_first(self):
+
+        client = FakeClient()
+        state = {}
+
+        list(self.get_stream(client).sync(state))
+
+        self.assertEqual(client.windows, [(5, 6), (3, 4), (1, 2)])
+        self.assertEqual(state['bookmarks']['report'], {
+            'completed_ranges': [['2019-01-01', '2019-01-06']],
+            'last_sync': '2019-01-06T00:00:00.000000Z'
+        })
+
+    def test_resumes_gaps(self):
+
+        client = FakeClient()
+        state = {'bookmarks': {'report': {
+            'completed_ranges': [['2019-01-03', '2019-01-04']]
+        }}}
+
+        list(self.get_stream(client).sync(state))
+
+        self.assertEqual(client.windows, [(5, 6), (1, 2)])
+
+
+class Test_Lookback(unittest.TestCase):
+
+    def get_stream(self, client, **config):
+        today = utils.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.days = [(today - timedelta(n)).day for n in (2, 1)]
+        return Stream(client, {
+            'report_slug': 'report',
+            'start_date': utils.strftime(today - timedelta(2)),
+            'lookback_days': 7,
+            **config
+        })
+
+    def test_lookback_starts_at_start_date(self):
+
+        client = FakeClient()
+        state = {}
+
+        list(self.get_stream(client).sync(state))
+
+        self.assertEqual(client.windows, [(day, day) for day in self.days])
+
+    def test_recency_first_lookback_starts_at_start_date(self):
+
+        client = FakeClient()
+
+        list(self.get_stream(client, recency_first=True).sync({}))
+
+        self.assertEqual(
+            client.windows,
+            [(day, day) for day in reversed(self.days)]
+        )
+
+    def test_lookback_resyncs_bookmarked_days(self):
+
+        client = FakeClient()
+        stream = self.get_stream(client)
+        state = {'bookmarks': {'report': {
+            'last_sync': utils.strftime(stream.utcnow - timedelta(1))
+        }}}
+
+        list(stream.sync(state))
+
+        self.assertEqual(client.windows, [(day, day) for day in self.days])
+
+
+class SerializingClient(FakeClient):
+    transform_pool = object()
+    columns = ['Transaction Date', 'Transaction Time', 'Sales', 'Product Name']
+
+    def get_cached_columns(self, report_slug):
+        return self.columns
+
+    def infer_schema(self, columns):
+        return Rakuten('TOKEN').infer_schema(columns)
+
+    def report(self, report_slug, start_date, end_date, **kwargs):
+        self.kwargs = kwargs
+        return iter([])
+
+
+class Test_SerializedRecords(unittest.TestCase):
+
+    def test_fields_missing_from_catalog_are_excluded(self):
+
+        client = SerializingClient()
+        stream = Stream(client, {
+            'report_slug': 'report',
+            'fast_transform': True
+        })
+        schema = client.infer_schema(client.columns)
+        del schema['properties']['sales']
+        stream.stream = Catalog.from_dict({'streams': [{
+            'stream': 'report',
+            'tap_stream_id': 'report',
+            'schema': schema,
+            'metadata': []
+        }]}).streams[0]
+        stream.excluded_fields = {'product_name'}
+
+        list(stream.sync_window(datetime(2019, 1, 1), datetime(2019, 1, 1)))
+
+        self.assertIsNotNone(client.kwargs['serialize'])
+        self.assertEqual(client.kwargs['exclude'], {'product_name', 'sales'})
+
+
+class Test_WindowTiming(unittest.TestCase):
+
+    def test_consumer_time_is_not_charged_to_the_window(self):
+
+        stream = Stream(FakeClient(), {
+            'report_slug': 'report',
+            'start_date': '2019-01-01T00:00:00Z'
+        })
+
+        with mock.patch.object(stream.planner, 'record') as record:
+            for row in stream.sync_window(datetime(2019, 1, 1), datetime(2019, 1, 1)):
+                time.sleep(0.2)
+
+        days, rows, seconds = record.call_args[0]
+        self.assertEqual((days, rows), (1, 1))
+        self.assertLess(seconds, 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+
+import threading
+import unittest
+from unittest import mock
+from datetime import datetime, timedelta, timezone
+from singer import metadata
+from singer.catalog import Catalog
+import tap_rakuten
+from tap_rakuten.client import Rakuten
+from tap_rakuten.streams import Stream, get_streams
+from tap_rakuten.sync import get_selected_fields, is_compiled_schema
+
+test_schema = {
+    "type": "object",
+    "properties": {
+        "num_of_clicks": {"type": ["integer", "null"]},
+        "publisher_name": {"type": ["string", "null"]},
+        "transaction_date": {"type": ["string", "null"], "format": "date-time"},
+        "sales": {"type": ["number", "null"]}
+    }
+}
+
+
+class Test_Sync(unittest.TestCase):
+
+    def test_get_selected_fields(self):
+
+        mdata = metadata.new()
+        mdata = metadata.write(
+            mdata, ('properties', 'transaction_date'), 'inclusion', 'automatic'
+        )
+        mdata = metadata.write(
+            mdata, ('properties', 'transaction_date'), 'selected', False
+        )
+        mdata = metadata.write(
+            mdata, ('properties', 'publisher_name'), 'selected', False
+        )
+        mdata = metadata.write(
+            mdata, ('properties', 'sales'), 'inclusion', 'unsupported'
+        )
+
+        self.assertEqual(
+            get_selected_fields(test_schema, mdata),
+            {'num_of_clicks', 'transaction_date'}
+        )
+
+    def test_is_compiled_schema(self):
+
+        compiled = Rakuten('TOKEN').infer_schema([
+            '# of Cancelled Items', 'Adjusted Commission',
+            'Transaction Date', 'Transaction Time'
+        ])
+
+        self.assertTrue(is_compiled_schema(compiled, compiled))
+        self.assertFalse(is_compiled_schema(compiled, None))
+
+        # properties the report doesn't have don't matter
+        self.assertTrue(is_compiled_schema({
+            "properties": {"sales": {"type": "number"}}
+        }, compiled))
+
+        self.assertFalse(is_compiled_schema({
+            "properties": {
+                "num_of_cancelled_items": {"type": ["string", "null"]}
+            }
+        }, compiled))
+
+        self.assertFalse(is_compiled_schema({
+            "properties": {
+                "transaction_datetime": {"type": ["string", "null"]}
+            }
+        }, compiled))
+
+
+class PollClient():
+    transform_pool = None
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+
+    def report(self, report_slug, start_date, validators, **kwargs):
+        rows = self.responses.pop(0)
+        validators['changed'] = rows is not None
+        return iter(rows or [])
+
+
+class Test_Poll(unittest.TestCase):
+
+    def test_emits_new_and_changed_rows(self):
+
+        client = PollClient([
+            [{'id': 1, 'sales': 1.0}, {'id': 2, 'sales': 1.0}],
+            [{'id': 1, 'sales': 1.0}, {'id': 2, 'sales': 2.0}],
+            None,
+            [{'id': 1, 'sales': 1.0}, {'id': 2, 'sales': 2.0},
+             {'id': 3, 'sales': 1.0}],
+        ])
+        stream = Stream(client, {
+            'report_slug': 'report',
+            'poll_interval': 60,
+            'poll_duration': 200
+        })
+
+        clock = [datetime(2019, 1, 10, 12, tzinfo=timezone.utc)]
+
+        def sleep(seconds):
+            clock[0] += timedelta(seconds=seconds)
+
+        with mock.patch('singer.utils.now', lambda: clock[0]), \
+                mock.patch('tap_rakuten.streams.time.sleep', sleep):
+            rows = [row for _, row in stream.poll()]
+
+        self.assertEqual(client.responses, [])
+        self.assertEqual(rows, [
+            {'id': 1, 'sales': 1.0},
+            {'id': 2, 'sales': 1.0},
+            {'id': 2, 'sales': 2.0},
+            {'id': 3, 'sales': 1.0}
+        ])
+
+
+def get_catalog(slugs):
+    return Catalog.from_dict({'streams': [
+        {
+            'stream': slug,
+            'tap_stream_id': slug.replace('-', '_'),
+            'schema': {
+                'type': 'object',
+                'properties': {'day': {'type': ['integer', 'null']}}
+            },
+            'metadata': [{
+                'breadcrumb': [],
+                'metadata': {'selected': True, 'table-key-properties': []}
+            }]
+        }
+        for slug in slugs
+    ]})
+
+
+class PollingStreamsClient():
+    """
+    The first poll of every stream waits for the first polls of the others,
+    so it only completes when all streams run at the same time.
+    """
+    transform_pool = None
+
+    def __init__(self, streams):
+        self.barrier = threading.Barrier(streams)
+
+    def report(self, report_slug, start_date, validators=None, **kwargs):
+        if validators is not None:
+            self.barrier.wait(timeout=5)
+            validators['changed'] = False
+            return iter([])
+        return iter([{'day': start_date.day}])
+
+
+class Test_PollStreams(unittest.TestCase):
+
+    def test_polls_more_streams_than_parallel_streams(self):
+
+        slugs = ['r-a', 'r-b', 'r-c']
+        yesterday = datetime.now(timezone.utc) - timedelta(1)
+
+        tap_rakuten.sync(
+            PollingStreamsClient(len(slugs)),
+            get_catalog(slugs),
+            {},
+            {
+                'reports': [{'report_slug': slug} for slug in slugs],
+                'start_date': yesterday.strftime('%Y-%m-%dT00:00:00Z'),
+                'parallel_streams': 1,
+                'poll_interval': 60,
+                'poll_duration': 0.001
+            }
+        )
+
+
+class StreamsClient():
+    """
+    Yields one row per day, except for the reports in `failing`.
+    """
+    transform_pool = None
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+
+    def report(self, report_slug, start_date, **kwargs):
+        if report_slug in self.failing:
+            raise ValueError('broken report')
+        return iter([{'day': start_date.day}])
+
+
+class Test_Streams(unittest.TestCase):
+
+    def test_get_streams(self):
+
+        streams = get_streams(None, {
+            'start_date': '2019-01-01T00:00:00Z',
+            'report_slug': 'ignored',
+            'reports': [
+                {'report_slug': 'Report-A'},
+                {'report_slug': 'report-b',
+                 'start_date': '2019-02-01T00:00:00Z'}
+            ]
+        })
+
+        self.assertEqual(
+            [(s.name, s.tap_stream_id, s.start_date) for s in streams],
+            [('Report-A', 'report_a', '2019-01-01T00:00:00Z'),
+             ('report-b', 'report_b', '2019-02-01T00:00:00Z')]
+        )
+
+    def test_client_keys_are_rejected_within_reports(self):
+
+        config = {
+            'token': 'x',
+            'region': 'en',
+            'date_type': 'transaction',
+            'start_date': '2019-01-01T00:00:00Z',
+            'reports': [
+                {'report_slug': 'report-a', 'date_type': 'process'},
+                {'report_slug': 'report-b', 'token': 'y', 'cache_dir': '/tmp'}
+            ]
+        }
+
+        with self.assertRaisesRegex(Exception, 'cache_dir, token of report report-b'):
+            tap_rakuten.check_config(config)
+
+        with self.assertRaisesRegex(Exception, 'top level'):
+            get_streams(None, config)
+
+        del config['reports'][1]['token'], config['reports'][1]['cache_dir']
+        tap_rakuten.check_config(config)
+
+    def test_get_streams_report_slug(self):
+
+        streams = get_streams(None, {'report_slug': 'my-report'})
+
+        self.assertEqual([s.tap_stream_id for s in streams], ['my_report'])
+
+    def test_sync_finishes_other_streams_before_raising(self):
+
+        slugs = ['r-a', 'r-b']
+        state = {}
+
+        with self.assertRaises(ValueError):
+            tap_rakuten.sync(
+                StreamsClient(failing=['r-a']),
+                get_catalog(slugs),
+                state,
+                {
+                    'reports': [{'report_slug': slug} for slug in slugs],
+                    'start_date': '2019-01-01T00:00:00Z',
+                    'end_date': '2019-01-02T00:00:00Z',
+                    'parallel_streams': 1
+                }
+            )
+
+        self.assertEqual(state['bookmarks'], {
+            'r_b': {'last_sync': '2019-01-02T00:00:00.000000Z'}
+        })
+
+
+if __name__ == '__main__':
+    unittest.main()